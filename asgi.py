@@ -0,0 +1,101 @@
+"""Async serving path for the search API.
+
+A plain ASGI application (no framework) for /searchAJAX, /complete,
+/metrics and /cacheStats, to run under any ASGI server:
+
+	uvicorn asgi:app --workers 4
+
+Requests wait on the event loop, not on a thread each. Identical
+concurrent searches are coalesced on the loop into one getList call,
+which runs on a small thread pool (pymongo is synchronous), so a trending
+query costs one pool thread and one Mongo query however many clients ask
+for it. Every request is answered within model.searchTimeout seconds,
+with a 504 when the search takes longer. Completions come from memory,
+on the same pool so a slow one never holds up the loop.
+
+The Flask app in main.py stays the serving path for the pages; point the
+proxy's /searchAJAX at this app to use it.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import time
+from urllib.parse import parse_qs
+import db
+import metrics
+import model
+
+
+pool = ThreadPoolExecutor(max_workers=int(db.setting("SEARCH_THREADS", 16)), thread_name_prefix="search")
+inflight = {}
+requestSeconds = metrics.histogram("asgi_request_seconds","ASGI request latency, by path",["path"])
+requestsTotal = metrics.counter("asgi_requests_total","ASGI requests, by path and status",["path","status"])
+#----------------------------------------------------------------------------------
+
+def query_args(scope):
+	return {name: values[0] for name, values in parse_qs(scope["query_string"].decode("latin-1")).items()}
+
+async def search(args):
+	"""model.searchResponse, shared with identical searches already running."""
+	query = args.get("search", "")
+	linkType = args.get("type", "all")
+	after = args.get("after") or None
+	key = model.searchKey(query, linkType, after)
+	future = inflight.get(key)
+	if future is None:
+		loop = asyncio.get_running_loop()
+		future = loop.run_in_executor(pool, model.searchResponse, query, linkType, after, model.searchTimeout)
+		inflight[key] = future
+		future.add_done_callback(lambda done: inflight.pop(key, None))
+	try:
+		#shield: one client giving up must not cancel the call the others wait on
+		return await asyncio.wait_for(asyncio.shield(future), model.searchTimeout)
+	except asyncio.TimeoutError:
+		return {'error':'True','timeout':'True'}, 504
+
+async def respond(send, status, body, content_type=b"application/json"):
+	if not isinstance(body, bytes):
+		body = json.dumps(body).encode("utf-8")
+	await send({"type":"http.response.start","status":status,
+		"headers":[(b"content-type", content_type),(b"content-length", str(len(body)).encode())]})
+	await send({"type":"http.response.body","body":body})
+
+async def app(scope, receive, send):
+	if scope["type"] == "lifespan":
+		while True:
+			message = await receive()
+			if message["type"] == "lifespan.startup":
+				await send({"type":"lifespan.startup.complete"})
+			elif message["type"] == "lifespan.shutdown":
+				pool.shutdown(wait=False)
+				await send({"type":"lifespan.shutdown.complete"})
+				return
+	if scope["type"] != "http":
+		return
+	start = time.perf_counter()
+	path = scope["path"]
+	if path not in ("/searchAJAX", "/complete", "/metrics", "/cacheStats"):
+		#one label for every unknown path
+		path = "404"
+		status, body, content_type = 404, {'error':'True'}, b"application/json"
+	elif scope["method"] != "GET":
+		status, body, content_type = 405, {'error':'True'}, b"application/json"
+	elif path == "/searchAJAX":
+		args = query_args(scope)
+		(body, status), content_type = await search(args), b"application/json"
+	elif path == "/complete":
+		args = query_args(scope)
+		k = int(args["k"]) if args.get("k", "").isdigit() else 10
+		completions = await asyncio.get_running_loop().run_in_executor(pool, model.getCompletions, args.get("q", ""), k)
+		status, body, content_type = 200, {'completions':completions}, b"application/json"
+	elif path == "/metrics":
+		status, body, content_type = 200, metrics.render().encode("utf-8"), metrics.CONTENT_TYPE.encode()
+	else:
+		status, body, content_type = 200, model.queryCache.stats(), b"application/json"
+	await respond(send, status, body, content_type)
+	requestSeconds.observe(time.perf_counter() - start, path=path)
+	requestsTotal.inc(path=path, status=status)
+
+if __name__ == '__main__':
+	import uvicorn
+	uvicorn.run(app, host=db.setting("SEARCH_HOST", "127.0.0.1"), port=int(db.setting("SEARCH_PORT", 8001)))
@@ -0,0 +1,172 @@
+"""Local stand-in for an open directory mirror.
+
+Serves a synthetic tree of Apache or nginx style autoindex pages so the
+crawler can be benchmarked without touching a real host. The tree is
+generated from its shape, nothing is stored on disk.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import gzip
+import hashlib
+import random
+import threading
+import time
+
+
+EXTENSIONS = ["mp4","mkv","mp3","ogg","zip","rar","iso","exe","jpg","png","pdf","txt","html","nfo"]
+#----------------------------------------------------------------------------------
+
+def apache_page(path, dirs, files):
+	rows = ['<tr><td valign="top"><img src="/icons/back.gif" alt="[PARENTDIR]"></td><td><a href="/">Parent Directory</a></td><td>&nbsp;</td><td align="right">  - </td></tr>']
+	for name in dirs:
+		rows.append('<tr><td valign="top"><img src="/icons/folder.gif" alt="[DIR]"></td><td><a href="%s/">%s/</a></td><td align="right">2019-01-01 00:00  </td><td align="right">  - </td></tr>' % (name, name))
+	for name in files:
+		rows.append('<tr><td valign="top"><img src="/icons/unknown.gif" alt="[   ]"></td><td><a href="%s">%s</a></td><td align="right">2019-01-01 00:00  </td><td align="right">1.2M</td></tr>' % (name, name))
+	return ('<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">\n<html>\n <head>\n  <title>Index of %s</title>\n </head>\n <body>\n<h1>Index of %s</h1>\n'
+		'  <table>\n   <tr><th valign="top"><img src="/icons/blank.gif" alt="[ICO]"></th><th><a href="?C=N;O=D">Name</a></th><th><a href="?C=M;O=A">Last modified</a></th><th><a href="?C=S;O=A">Size</a></th></tr>\n'
+		'%s\n</table>\n</body></html>\n') % (path, path, "\n".join(rows))
+
+def nginx_page(path, dirs, files):
+	rows = ['<a href="../">../</a>']
+	for name in dirs:
+		rows.append('<a href="%s/">%s/</a>%s01-Jan-2019 00:00                   -' % (name, name, " " * max(1, 50 - len(name))))
+	for name in files:
+		rows.append('<a href="%s">%s</a>%s01-Jan-2019 00:00             1234567' % (name, name, " " * max(1, 51 - len(name))))
+	return '<html>\n<head><title>Index of %s</title></head>\n<body>\n<h1>Index of %s</h1><hr><pre>%s\n</pre><hr></body>\n</html>\n' % (path, path, "\n".join(rows))
+
+class Tree(object):
+	"""Shape of the generated mirror: every directory above max depth has
+	fanout subdirectories and files_per_dir files."""
+
+	def __init__(self, depth=3, fanout=4, files_per_dir=20, style="apache"):
+		self.depth = depth
+		self.fanout = fanout
+		self.files_per_dir = files_per_dir
+		self.style = style
+
+	def listing(self, path):
+		parts = [p for p in path.split("/") if p]
+		if len(parts) > self.depth or any(not p.startswith("d") for p in parts):
+			return None
+		dirs = ["d%d" % i for i in range(self.fanout)] if len(parts) < self.depth else []
+		files = ["file-%s-%d.%s" % ("-".join(parts) or "root", i, EXTENSIONS[i % len(EXTENSIONS)]) for i in range(self.files_per_dir)]
+		page = apache_page if self.style == "apache" else nginx_page
+		return page(path, dirs, files)
+
+	def directories(self):
+		return sum(self.fanout ** level for level in range(self.depth + 1))
+
+	def links(self):
+		#links the crawler keeps: everything except html and nfo
+		kept = sum(1 for i in range(self.files_per_dir) if EXTENSIONS[i % len(EXTENSIONS)] not in ("html","nfo"))
+		return kept * self.directories()
+
+def serve(tree, latency=0.0, compress=True, host="127.0.0.1", port=0, rate_limit=None, flaky=0.0):
+	"""Start the stand-in server on a daemon thread, return (server, base url).
+
+	latency adds a fixed delay to every response to imitate a remote mirror,
+	compress gzips bodies for clients that accept it. Pages carry an ETag
+	and conditional requests for an unchanged page get a 304. The server counts the
+	connections it accepts in server.connections.
+
+	To imitate a mirror that throttles, rate_limit answers 429 with a
+	Retry-After to requests beyond that many a second, and flaky answers a
+	random fraction of requests with a bare 503. Requests served and refused are
+	counted in server.served and server.throttled."""
+	class Handler(BaseHTTPRequestHandler):
+		protocol_version = "HTTP/1.1"
+
+		def do_GET(self):
+			if latency:
+				time.sleep(latency)
+			if self.refuse():
+				return
+			page = tree.listing(self.path.split("?")[0])
+			if page is None:
+				self.send_error(404)
+				return
+			body = page.encode("utf-8")
+			etag = '"%s"' % hashlib.md5(body).hexdigest()
+			if self.headers.get("If-None-Match") == etag:
+				self.send_response(304)
+				self.send_header("ETag", etag)
+				self.send_header("Content-Length", "0")
+				self.end_headers()
+				return
+			self.send_response(200)
+			self.send_header("ETag", etag)
+			if compress and "gzip" in self.headers.get("Accept-Encoding", ""):
+				body = gzip.compress(body, 6)
+				self.send_header("Content-Encoding", "gzip")
+			self.send_header("Content-Type", "text/html;charset=UTF-8")
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def refuse(self):
+			now = time.monotonic()
+			with server.lock:
+				if rate_limit:
+					if now - server.window >= 1.0:
+						server.window = now
+						server.window_count = 0
+					server.window_count += 1
+					limited = server.window_count > rate_limit
+				else:
+					limited = False
+				if limited or (flaky and random.random() < flaky):
+					server.throttled += 1
+				else:
+					server.served += 1
+					return False
+			if limited:
+				self.send_response(429)
+				self.send_header("Retry-After", "1")
+			else:
+				self.send_response(503)
+			self.send_header("Content-Length", "0")
+			self.end_headers()
+			return True
+
+		def setup(self):
+			server.connections += 1
+			BaseHTTPRequestHandler.setup(self)
+
+		def log_message(self, format, *args):
+			pass
+
+	server = ThreadingHTTPServer((host, port), Handler)
+	server.daemon_threads = True
+	server.connections = 0
+	server.lock = threading.Lock()
+	server.window = time.monotonic()
+	server.window_count = 0
+	server.served = 0
+	server.throttled = 0
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server, "http://%s:%d/" % server.server_address
+
+#----------------------------------------------------------------------------------
+
+class ListWriter(object):
+	"""In-memory stand-in for writer.LinkWriter, so benchmarks measure the
+	crawl and not the database."""
+
+	def __init__(self):
+		self.links = []
+		self.urls = []
+		self.errors = []
+
+	def add_links(self, docs):
+		self.links.extend(docs)
+
+	def add_url(self, url):
+		self.urls.append(url)
+
+	def add_error(self, url):
+		self.errors.append(url)
+
+	def flush(self):
+		pass
+
+	def close(self):
+		pass
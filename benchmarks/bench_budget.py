@@ -0,0 +1,64 @@
+"""Links found by a page-budgeted crawl, FIFO against the priority frontier.
+
+The stub mirror puts most of its files in one top-level subtree (the last
+one listed, so breadth first order reaches it last); a budget of --pages
+pages shows how much of it each order gets to.
+
+	python benchmarks/bench_budget.py --pages 20 40 80
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import budget
+import crawler
+import frontier
+from autoindex import Tree, serve, ListWriter
+
+
+class SkewedTree(Tree):
+	"""Directories under the last top-level subdirectory hold files_per_dir
+	files, every other one a tenth of that."""
+
+	def listing(self, path):
+		parts = [p for p in path.split("/") if p]
+		rich = parts[:1] == ["d%d" % (self.fanout - 1)]
+		files_per_dir = self.files_per_dir
+		self.files_per_dir = files_per_dir if rich else max(1, files_per_dir // 10)
+		try:
+			return Tree.listing(self, path)
+		finally:
+			self.files_per_dir = files_per_dir
+
+def run(base, pages, priority):
+	links = ListWriter()
+	queue = frontier.PriorityFrontier() if priority else None
+	start = time.perf_counter()
+	result = crawler.Crawler(links, max_workers=4, per_host=4, frontier=queue, budget=budget.Budget(max_pages=pages)).crawl(base)
+	return time.perf_counter() - start, result, links
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--depth", type=int, default=4)
+	parser.add_argument("--fanout", type=int, default=4)
+	parser.add_argument("--files", type=int, default=40)
+	parser.add_argument("--pages", type=int, nargs="+", default=[20, 40, 80])
+	args = parser.parse_args()
+
+	tree = SkewedTree(args.depth, args.fanout, args.files)
+	server, base = serve(tree)
+	print("tree: %d directories, %d in the rich subtree" % (tree.directories(), sum(args.fanout ** level for level in range(args.depth))))
+	try:
+		for pages in args.pages:
+			for priority in (False, True):
+				elapsed, result, links = run(base, pages, priority)
+				print("pages=%-4d %-8s %6.2fs  pages %-4d links %-6d cut %d" % (
+					pages, "priority" if priority else "fifo", elapsed, result.pages, len(links.links), result.budget.cut))
+	finally:
+		server.shutdown()
+
+if __name__ == '__main__':
+	main()
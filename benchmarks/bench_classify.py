@@ -0,0 +1,103 @@
+"""classifier.classify / classify_all against the old endswith() chain.
+
+Also checks that every URL where the two disagree is one of the bug fixes
+listed in classifier's docstring, and fails otherwise.
+
+	python benchmarks/bench_classify.py --urls 3000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import classifier
+
+
+def legacy(fullLink):
+	#the chain copied in model.Crawl, mongo.main and sandbox/intitle_crawler.py
+	if fullLink.lower().endswith(("mp4","mkv","3gp","avi","mov","mpg","mpeg","wmv","m4v")):
+		return "video"
+	elif fullLink.lower().endswith(("mp3","aif","mid","midi","mpa","ogg","wav","wma","wpl")):
+		return "audio"
+	elif fullLink.lower().endswith(("rar","zip","deb","pkg","tar.gz",".z","rpm",".7z","arj")):
+		return "compressed"
+	elif fullLink.lower().endswith(("bin","dmg","iso","toast","vcd")):
+		return "disk"
+	elif fullLink.lower().endswith(("exe","apk","bat","com","jar",".py",".wsf")):
+		return "executable"
+	elif fullLink.lower().endswith(("ai","bmp","gif","ico","jpeg","png","jpg","tif","svg")):
+		return "image"
+	elif fullLink.lower().endswith(("pdf","txt","doc","rtf","wpd","docx","odt","wps","wks")):
+		return "text"
+	return None
+
+def documented(url, old, new):
+	#reason the new classifier may disagree with the old chain, or None
+	if "?" in url or "#" in url:
+		return "query or fragment"
+	if old is not None and new is None:
+		name = url.lower()
+		if not name.startswith(("http://", "https://")):
+			return "not http"
+		if name.find("/", name.find("://") + 3) < 0:
+			return "bare host"
+		#the old chain matched the end of a word, not one of old's extensions
+		last = name[name.rfind("/") + 1:]
+		if not any(last.endswith("." + extension) for extension in classifier.TYPES[old]):
+			return "bare suffix"
+	return None
+
+def urls(count, seed=7):
+	extensions = [e for extensions in classifier.TYPES.values() for e in extensions] + ["html","nfo","srt","gz","part","MP4","Mkv"]
+	words = ["mail","cabin","telecom","domain","sabin","film","track","setup","album","backup"]
+	rnd = random.Random(seed)
+	made = []
+	for i in range(count):
+		kind = rnd.random()
+		base = "http://mirror%d.example.org/pub/%s/" % (i % 50, rnd.choice(words))
+		if kind < 0.80:
+			made.append(base + "%s-%d.%s" % (rnd.choice(words), i, rnd.choice(extensions)))
+		elif kind < 0.90:
+			made.append(base + "%s%d%s" % (rnd.choice(words), i, rnd.choice(words)))
+		elif kind < 0.95:
+			made.append(base + "?C=%s;O=A" % rnd.choice("NMSD"))
+		else:
+			made.append("http://%s%d.com" % (rnd.choice(words), i))
+	return made
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--urls", type=int, default=3000000)
+	parser.add_argument("--page", type=int, default=500, help="links per classify_all call")
+	args = parser.parse_args()
+
+	data = urls(args.urls)
+	start = time.perf_counter()
+	old = [legacy(url) for url in data]
+	legacy_time = time.perf_counter() - start
+	start = time.perf_counter()
+	new = [classifier.classify(url) for url in data]
+	single_time = time.perf_counter() - start
+	start = time.perf_counter()
+	batch = []
+	for i in range(0, len(data), args.page):
+		batch.extend(classifier.classify_all(data[i:i + args.page]))
+	batch_time = time.perf_counter() - start
+
+	for name, elapsed in (("endswith chain", legacy_time), ("classify", single_time), ("classify_all", batch_time)):
+		print("%-15s %6.2fs %10.0f urls/s" % (name, elapsed, len(data) / elapsed))
+
+	assert new == batch, "classify_all disagrees with classify"
+	reasons = {}
+	for url, a, b in zip(data, old, new):
+		if a != b:
+			reason = documented(url, a, b)
+			assert reason is not None, "undocumented difference: %s %s -> %s" % (url, a, b)
+			reasons[reason] = reasons.get(reason, 0) + 1
+	print("same result for %d of %d urls, fixed: %s" % (len(data) - sum(reasons.values()), len(data), reasons))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,75 @@
+"""Completion latency of complete.PrefixIndex over a Zipf-like vocabulary.
+
+Link names are drawn from --words random words, half of them from a
+heavy-tailed distribution so a few words are in many names, as release
+groups and formats are. Prefixes of one to six letters of random words
+are completed; the index is then grown by batches of --batch names, as
+Completions.refresh does after a crawl, and the prefixes replayed.
+
+	python benchmarks/bench_complete.py --links 1000000 --words 300000
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import complete
+
+
+def names(vocabulary, count, rnd):
+	for _ in range(count):
+		words = []
+		for _ in range(4):
+			if rnd.random() < 0.5:
+				words.append(vocabulary[min(int(rnd.paretovariate(0.8)) - 1, len(vocabulary) - 1)])
+			else:
+				words.append(rnd.choice(vocabulary))
+		yield {"name":" ".join(words)}
+
+def replay(index, prefixes):
+	latencies = []
+	for prefix in prefixes:
+		start = time.perf_counter()
+		index.complete(prefix, 10)
+		latencies.append(time.perf_counter() - start)
+	latencies.sort()
+	pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1e6
+	return "p50 %6.1fus  p99 %6.1fus  max %8.1fus" % (pick(0.5), pick(0.99), latencies[-1] * 1e6)
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--links", type=int, default=1000000)
+	parser.add_argument("--words", type=int, default=300000)
+	parser.add_argument("--batch", type=int, default=1000)
+	parser.add_argument("--queries", type=int, default=100000)
+	args = parser.parse_args()
+
+	rnd = random.Random(5)
+	vocabulary = ["".join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(3, 9))) for _ in range(args.words)]
+	index = complete.PrefixIndex()
+	start = time.perf_counter()
+	docs = []
+	for doc in names(vocabulary, args.links, rnd):
+		docs.append(doc)
+		if len(docs) == 10000:
+			index.add(docs)
+			docs = []
+	index.add(docs)
+	print("index: %d links, %d words, built in %.1fs" % (args.links, len(index), time.perf_counter() - start))
+	prefixes = [word[:rnd.randint(1, 6)] for word in (rnd.choice(vocabulary) for _ in range(args.queries))]
+	print("cold       ", replay(index, prefixes))
+	print("warm       ", replay(index, prefixes))
+	adds = []
+	for _ in range(20):
+		batch = list(names(vocabulary, args.batch, rnd))
+		start = time.perf_counter()
+		index.add(batch)
+		adds.append(time.perf_counter() - start)
+	print("after adds ", replay(index, prefixes), " add %d names: %.1fms mean" % (args.batch, sum(adds) / len(adds) * 1000))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,46 @@
+"""Sequential versus concurrent crawl of a synthetic autoindex tree.
+
+	python benchmarks/bench_crawl.py --depth 3 --fanout 5 --latency 0.02
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crawler
+from autoindex import Tree, serve, ListWriter
+
+
+def run(base, max_workers, per_host):
+	links = ListWriter()
+	start = time.perf_counter()
+	result = crawler.Crawler(links, max_workers=max_workers, per_host=per_host).crawl(base)
+	return time.perf_counter() - start, result, links
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--depth", type=int, default=3)
+	parser.add_argument("--fanout", type=int, default=5)
+	parser.add_argument("--files", type=int, default=30)
+	parser.add_argument("--style", choices=("apache","nginx"), default="apache")
+	parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every response")
+	parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16, 32])
+	args = parser.parse_args()
+
+	tree = Tree(args.depth, args.fanout, args.files, args.style)
+	server, base = serve(tree, latency=args.latency)
+	print("tree: %d directories, %d links, %s style, %.0fms latency" % (tree.directories(), tree.links(), args.style, args.latency * 1000))
+	baseline = None
+	try:
+		for workers in args.workers:
+			elapsed, result, links = run(base, workers, workers)
+			assert result.pages == tree.directories() and len(links.links) == tree.links(), "incomplete crawl"
+			baseline = baseline or elapsed
+			print("workers=%-3d %7.2fs %8.1f pages/s  speedup x%.1f" % (workers, elapsed, result.pages / elapsed, baseline / elapsed))
+	finally:
+		server.shutdown()
+
+if __name__ == '__main__':
+	main()
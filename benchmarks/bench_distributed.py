@@ -0,0 +1,76 @@
+"""Crawl one synthetic tree with 1, 2, 4... worker processes sharing a
+frontier.MongoFrontier, each with a small thread pool, and check every run
+finds exactly the links a single worker does.
+
+Needs a MongoDB for the queue (collection "queue" in the "benchlinks"
+database by default, dropped before every run). Workers stand in for
+nodes; the stub server's latency is what they wait on.
+
+	python benchmarks/bench_distributed.py --workers 1 2 4 8 --latency 0.05
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pymongo
+import crawler
+import frontier
+from autoindex import Tree, serve, ListWriter
+
+
+def worker(uri, database, name, threads, out):
+	queue = frontier.MongoFrontier(pymongo.MongoClient(uri)[database]["queue"], name, poll=0.2)
+	links = ListWriter()
+	result = crawler.Crawler(links, max_workers=threads, per_host=threads, frontier=queue, checkpoint_every=10).crawl()
+	queue.close()
+	out.put((result.pages, [doc["link"] for doc in links.links], queue.reclaimed))
+
+def run(uri, database, base, workers, threads):
+	collection = pymongo.MongoClient(uri)[database]["queue"]
+	collection.drop()
+	frontier.MongoFrontier(collection, "seed").add([(base, 0)])
+	out = multiprocessing.Queue()
+	start = time.perf_counter()
+	processes = [multiprocessing.Process(target=worker, args=(uri, database, "bench-%d" % i, threads, out)) for i in range(workers)]
+	for process in processes:
+		process.start()
+	results = [out.get() for process in processes]
+	elapsed = time.perf_counter() - start
+	for process in processes:
+		process.join()
+	return elapsed, results
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--mongo", default="mongodb://localhost:27017")
+	parser.add_argument("--database", default="benchlinks")
+	parser.add_argument("--depth", type=int, default=3)
+	parser.add_argument("--fanout", type=int, default=6)
+	parser.add_argument("--files", type=int, default=20)
+	parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+	parser.add_argument("--threads", type=int, default=4, help="fetch threads per worker")
+	parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+	args = parser.parse_args()
+
+	tree = Tree(args.depth, args.fanout, args.files)
+	server, base = serve(tree, latency=args.latency)
+	print("tree: %d directories, %d links, %.0fms latency, %d threads a worker" % (tree.directories(), tree.links(), args.latency * 1000, args.threads))
+	baseline = None
+	try:
+		for workers in args.workers:
+			elapsed, results = run(args.mongo, args.database, base, workers, args.threads)
+			pages = sum(result[0] for result in results)
+			links = set(link for result in results for link in result[1])
+			assert pages == tree.directories() and len(links) == tree.links(), "incomplete crawl"
+			baseline = baseline or elapsed
+			print("workers=%-3d %7.2fs %8.1f pages/s  speedup x%.1f  pages per worker %s" % (
+				workers, elapsed, pages / elapsed, baseline / elapsed, [result[0] for result in results]))
+	finally:
+		server.shutdown()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,62 @@
+"""Export and import throughput of dump.py over the synthetic corpus.
+
+The corpus is bench_search.py's synthetic one, filled to --links.
+It is exported with each --shards count, then dropped and imported back
+from the files of the widest export with as many workers. Mongo is the
+one db.py connects to, the database --database (benchdump by default).
+The corpus collection is dropped, so the benchmark refuses links, the
+LINKS_DATABASE of its environment, and a database whose links it did not
+write itself (it leaves a mark in the database's meta collection).
+
+	python benchmarks/bench_dump.py --links 10000000 --shards 1 4
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import dump
+from bench_search import corpus
+
+#real links databases, never dropped
+PROTECTED = frozenset(name for name in ("links", os.environ.get("LINKS_DATABASE")) if name)
+MARK = {"_id":"bench_dump"}
+
+
+def run(action, function, *args):
+	start = time.perf_counter()
+	stats = function(*args)
+	dump.report(action, stats, time.perf_counter() - start)
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--links", type=int, default=10000000)
+	parser.add_argument("--shards", type=int, nargs="+", default=[1, 4])
+	parser.add_argument("--path", default="bench_links.ndjson.gz")
+	parser.add_argument("--database", default="benchdump", help="scratch links database")
+	args = parser.parse_args()
+	if args.database in PROTECTED:
+		parser.error("--database %s holds real links, pick a scratch database" % args.database)
+	#dump.py works on db.links("links"), which now is the scratch database
+	os.environ["LINKS_DATABASE"] = args.database
+
+	collection = db.links("links").resolve()
+	meta = db.links("meta").resolve()
+	if meta.find_one(MARK) is None:
+		if collection.estimated_document_count():
+			parser.error("%s.links was not written by this benchmark, pick another --database" % args.database)
+		meta.insert_one(MARK)
+	corpus(collection, args.links)
+	for shards in args.shards:
+		run("export, %d shard(s):" % shards, dump.export, args.path, shards)
+	widest = max(args.shards)
+	paths = [dump.shard_path(args.path, shard) for shard in range(widest)] if widest > 1 else [args.path]
+	#the import rebuilds the corpus it was exported from
+	collection.drop()
+	run("import, %d file(s):" % len(paths), dump.load, [path for path in paths if os.path.exists(path)], widest)
+
+if __name__ == '__main__':
+	main()
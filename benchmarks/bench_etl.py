@@ -0,0 +1,72 @@
+"""Rows per second through the mongo.main ETL transform for 1, 2, 4 and 8
+workers, on a synthetic book_links dump shaped like sandbox/books.sql.
+
+MySQL and Mongo are left out: rows come from an in-memory cursor and
+the transformed batches go to a writer that only counts them.
+
+	python benchmarks/bench_etl.py --rows 2000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mongo
+
+WORDS = ["Python","Cookbook","Learning","Linux","Kernel","Programming","Guide","Data","Structures","Algorithms","Gentoomen","Library"]
+EXTENSIONS = ["pdf","chm","epub","djvu","zip","txt","mp4","mp3","html"]
+
+
+def rows(count, seed=3):
+	rnd = random.Random(seed)
+	made = []
+	for i in range(1, count + 1):
+		name = "%s %s %s.%s" % (rnd.choice(WORDS), rnd.choice(WORDS), rnd.choice(WORDS), rnd.choice(EXTENSIONS))
+		link = "https://theswissbay.ch/pdf/Gentoomen%%20Library/%s/%s" % (rnd.choice(WORDS), name.replace(" ", "%20"))
+		made.append((i, name, link))
+	return made
+
+class Cursor(object):
+	def __init__(self, rows):
+		self.rows = rows
+
+	def execute(self, sql, args):
+		self.position = 0
+
+	def fetchmany(self, size):
+		batch = self.rows[self.position:self.position + size]
+		self.position += size
+		return batch
+
+class CountingWriter(object):
+	def __init__(self):
+		self.links = 0
+
+	def add_links(self, docs):
+		self.links += len(docs)
+
+	def flush(self):
+		pass
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--rows", type=int, default=1000000)
+	parser.add_argument("--batch-size", type=int, default=5000)
+	parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+	args = parser.parse_args()
+
+	data = rows(args.rows)
+	for workers in args.workers:
+		marks = []
+		out = CountingWriter()
+		start = time.perf_counter()
+		links, last = mongo.transfer(Cursor(data), out, 0, args.batch_size, marks.append, workers)
+		elapsed = time.perf_counter() - start
+		assert last == args.rows and marks == sorted(marks), "watermark out of order"
+		print("workers=%d %7.2fs %10.0f rows/s" % (workers, elapsed, args.rows / elapsed))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,56 @@
+"""Link extraction micro-benchmark: BeautifulSoup tree versus the streaming
+lxml parser in listing.py, pages per second and peak RSS.
+
+Each backend runs in its own process so ru_maxrss is not shared.
+
+	python benchmarks/bench_parse.py --entries 1000 20000 --pages 5
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import listing
+from autoindex import apache_page, nginx_page, EXTENSIONS
+
+BACKENDS = {"soup": listing.soup_links, "lxml": listing.lxml_links}
+
+
+def page(style, entries):
+	files = ["file-%d.%s" % (i, EXTENSIONS[i % len(EXTENSIONS)]) for i in range(entries)]
+	return (apache_page if style == "apache" else nginx_page)("/bench/", ["d0", "d1"], files).encode("utf-8")
+
+def measure(backend, style, entries, pages):
+	body = page(style, entries)
+	before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	start = time.perf_counter()
+	for _ in range(pages):
+		links = BACKENDS[backend](body)
+	elapsed = time.perf_counter() - start
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	print("%-5s %-6s entries=%-7d %8.2f pages/s  links=%d  peak rss=%dMB (+%dMB)" % (
+		backend, style, entries, pages / elapsed, len(links), peak // 1024, (peak - before) // 1024))
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--entries", type=int, nargs="+", default=[1000, 5000])
+	parser.add_argument("--pages", type=int, default=5)
+	parser.add_argument("--style", choices=("apache","nginx"), default="apache")
+	parser.add_argument("--backend", choices=sorted(BACKENDS), help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.backend:
+		for entries in args.entries:
+			measure(args.backend, args.style, entries, args.pages)
+		return
+	for entries in args.entries:
+		for backend in sorted(BACKENDS):
+			subprocess.check_call([sys.executable, __file__, "--backend", backend, "--style", args.style,
+				"--pages", str(args.pages), "--entries", str(entries)])
+
+if __name__ == '__main__':
+	main()
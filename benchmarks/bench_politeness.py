@@ -0,0 +1,58 @@
+"""Crawl several throttling mirrors at once, with and without a rate limit.
+
+Every stub server answers 429 beyond --limit requests a second (and 503 to
+a --flaky fraction); ports count as separate hosts, so the crawl shows
+whether the scheduler keeps each host under its limit while the other
+hosts keep the workers busy.
+
+	python benchmarks/bench_politeness.py --hosts 4 --limit 20 --rates 0 15
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crawler
+from autoindex import Tree, serve, ListWriter
+
+
+def run(tree, args, rate):
+	servers = [serve(tree, latency=args.latency, rate_limit=args.limit, flaky=args.flaky) for i in range(args.hosts)]
+	links = ListWriter()
+	try:
+		start = time.perf_counter()
+		result = crawler.Crawler(links, max_workers=args.workers, per_host=args.per_host, rate=rate or None).crawl(*[base for server, base in servers])
+		elapsed = time.perf_counter() - start
+	finally:
+		for server, base in servers:
+			server.shutdown()
+	return elapsed, result, links, [server for server, base in servers]
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--depth", type=int, default=3)
+	parser.add_argument("--fanout", type=int, default=4)
+	parser.add_argument("--files", type=int, default=10)
+	parser.add_argument("--latency", type=float, default=0.01, help="seconds added to every response")
+	parser.add_argument("--hosts", type=int, default=4)
+	parser.add_argument("--limit", type=int, default=20, help="requests a second each host serves before answering 429")
+	parser.add_argument("--flaky", type=float, default=0.0, help="fraction of requests answered with 503")
+	parser.add_argument("--workers", type=int, default=16)
+	parser.add_argument("--per-host", type=int, default=4)
+	parser.add_argument("--rates", type=float, nargs="+", default=[0, 15], help="crawler requests a second per host, 0 for unlimited")
+	args = parser.parse_args()
+
+	tree = Tree(args.depth, args.fanout, args.files)
+	print("%d hosts x %d directories, %d req/s limit, %.0f%% flaky" % (args.hosts, tree.directories(), args.limit, args.flaky * 100))
+	for rate in args.rates:
+		elapsed, result, links, servers = run(tree, args, rate)
+		served = sum(server.served for server in servers)
+		refused = sum(server.throttled for server in servers)
+		print("rate=%-5s %6.2fs %7.1f pages/s  %5.1f req/s/host  refused %-5d retried %-5d errors %d" % (
+			rate or "-", elapsed, result.pages / elapsed, served / elapsed / args.hosts,
+			refused, result.hosts.retried, len(links.errors)))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,193 @@
+"""Search latency under concurrent load: the Flask app against the ASGI app.
+
+A closed-loop load generator: --clients concurrent clients each send
+their next request as soon as the last one is answered. A --hot share of
+requests ask for one trending query, the rest for distinct ones. With
+--no-cache the query cache keeps nothing, as when crawls keep bumping the
+generation, so every request reaches the backend unless it is coalesced.
+
+The backend is a stand-in for search.find that sleeps --backend-latency
+seconds, unless --mongo is given (then model's collections are used as
+configured by db.py). Modes:
+
+- flask: main.app on a threaded werkzeug server in a child process
+- asgi: asgi.app called in process, no HTTP, the event loop only
+- asgi-http: asgi.app under uvicorn in a child process (needs uvicorn)
+
+	python benchmarks/bench_serve.py --modes flask asgi --clients 200 --no-cache
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+import metrics
+import model
+import search
+
+BACKEND_CALLS = metrics.counter("bench_backend_calls_total", "Calls that reached the search backend")
+
+
+def stub_backend(latency):
+	def find(collection, query, linkType=None, after=None, limit=10, max_time_ms=None):
+		BACKEND_CALLS.inc()
+		time.sleep(latency)
+		return [{"_id":"%024x" % i,"name":"%s %d" % (query, i),"link":"http://example.org/%s/%d.mp4" % (query, i),"type":"video"} for i in range(limit)], None
+	search.find = find
+
+def setup(args):
+	if not args.mongo:
+		stub_backend(args.backend_latency)
+		#no links.meta to read the generation or changes from either
+		model.queryCache.generation = None
+		model.queryCache.changes = None
+	if args.no_cache:
+		model.queryCache.maxsize = 0
+
+def queries(args, seed):
+	rnd = random.Random(seed)
+	while True:
+		yield "trending" if rnd.random() < args.hot else "rare%d" % rnd.randrange(1 << 30)
+
+def percentiles(latencies):
+	ordered = sorted(latencies)
+	pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000
+	return pick(0.50), pick(0.95), pick(0.99)
+
+def backend_calls(text):
+	for line in text.splitlines():
+		if line.startswith("bench_backend_calls_total"):
+			return int(float(line.split()[-1]))
+	return None
+
+#----------------------------------------------------------------------------------
+
+def serve_flask(args, port):
+	from werkzeug.serving import make_server
+	import logging
+	import main
+	logging.getLogger("werkzeug").setLevel(logging.ERROR)
+	setup(args)
+	make_server("127.0.0.1", port, main.app, threaded=True).serve_forever()
+
+def serve_uvicorn(args, port):
+	import uvicorn
+	import asgi
+	setup(args)
+	uvicorn.run(asgi.app, host="127.0.0.1", port=port, log_level="warning")
+
+def load_http(args, base):
+	latencies = []
+	statuses = {}
+	lock = threading.Lock()
+	remaining = [args.requests]
+
+	def client(seed):
+		session = requests.Session()
+		names = queries(args, seed)
+		while True:
+			with lock:
+				if remaining[0] <= 0:
+					return
+				remaining[0] -= 1
+			start = time.perf_counter()
+			status = session.get(base + "/searchAJAX", params={"search":next(names),"type":"all"}, timeout=60).status_code
+			elapsed = time.perf_counter() - start
+			with lock:
+				latencies.append(elapsed)
+				statuses[status] = statuses.get(status, 0) + 1
+
+	threads = [threading.Thread(target=client, args=(seed,)) for seed in range(args.clients)]
+	start = time.perf_counter()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	return time.perf_counter() - start, latencies, statuses, backend_calls(requests.get(base + "/metrics").text)
+
+def run_server(target, args):
+	port = args.port
+	process = multiprocessing.Process(target=target, args=(args, port), daemon=True)
+	process.start()
+	base = "http://127.0.0.1:%d" % port
+	for _ in range(100):
+		try:
+			requests.get(base + "/cacheStats", timeout=1)
+			break
+		except requests.ConnectionError:
+			time.sleep(0.1)
+	try:
+		return load_http(args, base)
+	finally:
+		process.terminate()
+		process.join()
+
+def run_asgi(args):
+	import asgi
+	setup(args)
+	latencies = []
+	statuses = {}
+
+	async def call(name):
+		sent = []
+		async def receive():
+			return {"type":"http.request","body":b"","more_body":False}
+		async def send(message):
+			sent.append(message)
+		scope = {"type":"http","method":"GET","path":"/searchAJAX","query_string":("search=%s&type=all" % name).encode()}
+		start = time.perf_counter()
+		await asgi.app(scope, receive, send)
+		latencies.append(time.perf_counter() - start)
+		status = sent[0]["status"]
+		statuses[status] = statuses.get(status, 0) + 1
+
+	async def client(seed, remaining):
+		names = queries(args, seed)
+		while remaining[0] > 0:
+			remaining[0] -= 1
+			await call(next(names))
+
+	async def main():
+		remaining = [args.requests]
+		await asyncio.gather(*[client(seed, remaining) for seed in range(args.clients)])
+
+	calls = backend_calls(metrics.render()) or 0
+	start = time.perf_counter()
+	asyncio.run(main())
+	return time.perf_counter() - start, latencies, statuses, (backend_calls(metrics.render()) or 0) - calls
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--modes", nargs="+", choices=("flask", "asgi", "asgi-http"), default=["flask", "asgi"])
+	parser.add_argument("--clients", type=int, default=100)
+	parser.add_argument("--requests", type=int, default=5000)
+	parser.add_argument("--hot", type=float, default=0.8, help="share of requests for the trending query")
+	parser.add_argument("--backend-latency", type=float, default=0.05, help="seconds the stand-in backend takes")
+	parser.add_argument("--mongo", action="store_true", help="search the real links collection instead of the stand-in")
+	parser.add_argument("--no-cache", action="store_true", help="keep nothing in the query cache")
+	parser.add_argument("--port", type=int, default=8765)
+	args = parser.parse_args()
+
+	print("%d clients, %d requests, %.0f%% trending, backend %s, cache %s" % (args.clients, args.requests, args.hot * 100,
+		"mongo" if args.mongo else "%.0fms stand-in" % (args.backend_latency * 1000), "off" if args.no_cache else "on"))
+	for mode in args.modes:
+		if mode == "flask":
+			elapsed, latencies, statuses, calls = run_server(serve_flask, args)
+		elif mode == "asgi-http":
+			elapsed, latencies, statuses, calls = run_server(serve_uvicorn, args)
+		else:
+			elapsed, latencies, statuses, calls = run_asgi(args)
+		p50, p95, p99 = percentiles(latencies)
+		print("%-9s %8.1f req/s  p50 %7.1fms  p95 %7.1fms  p99 %7.1fms  mean %7.1fms  backend calls %-6s status %s" % (
+			mode, len(latencies) / elapsed, p50, p95, p99, statistics.mean(latencies) * 1000, calls, statuses))
+
+if __name__ == '__main__':
+	main()
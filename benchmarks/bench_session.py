@@ -0,0 +1,59 @@
+"""Connection reuse and transfer size: one urllib connection per page versus
+the pooled fetcher.Session, over a thousand-directory synthetic index.
+
+	python benchmarks/bench_session.py --depth 3 --fanout 10
+"""
+import argparse
+import os
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crawler
+import fetcher
+from autoindex import Tree, serve, ListWriter
+
+
+def urllib_fetch(url):
+	#what Crawl used to do: a new connection and an uncompressed body per page
+	request = urllib.request.Request(url, headers={'User-Agent': fetcher.user_agent})
+	response = urllib.request.urlopen(request)
+	try:
+		body = response.read()
+		urllib_fetch.bytes += len(body)
+		return body
+	finally:
+		response.close()
+urllib_fetch.bytes = 0
+
+def run(server, base, fetch, workers):
+	server.connections = 0
+	start = time.perf_counter()
+	result = crawler.Crawler(ListWriter(), max_workers=workers, per_host=workers, fetch=fetch).crawl(base)
+	return time.perf_counter() - start, result.pages, server.connections
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--depth", type=int, default=3)
+	parser.add_argument("--fanout", type=int, default=10)
+	parser.add_argument("--files", type=int, default=30)
+	parser.add_argument("--workers", type=int, default=8)
+	args = parser.parse_args()
+
+	tree = Tree(args.depth, args.fanout, args.files)
+	server, base = serve(tree)
+	print("tree: %d directories" % tree.directories())
+	try:
+		elapsed, pages, connections = run(server, base, urllib_fetch, args.workers)
+		print("urllib   %7.2fs pages=%d connections=%d bytes=%d" % (elapsed, pages, connections, urllib_fetch.bytes))
+		session = fetcher.Session(pool_maxsize=args.workers)
+		elapsed, pages, connections = run(server, base, session.get, args.workers)
+		stats = session.stats()
+		print("session  %7.2fs pages=%d connections=%d bytes=%d (decoded %d) reused=%d" % (elapsed, pages, connections, stats["bytes_wire"], stats["bytes_body"], stats["reused"]))
+	finally:
+		server.shutdown()
+
+if __name__ == '__main__':
+	main()
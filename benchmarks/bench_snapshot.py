@@ -0,0 +1,100 @@
+"""Search from a snapshot file against search from Mongo: query latency and
+memory per worker process.
+
+Each of --workers processes opens its own copy of the search path, as
+Flask workers do, and replays the benchmark queries. Memory is read from
+/proc/self/status after the queries: RssFile is mapped file pages, which
+workers share through the page cache, RssAnon is the worker's own.
+
+With --uri the corpus is the synthetic one bench_search.py keeps in
+Mongo and both paths are measured; without it only the snapshot is,
+built from the same generator.
+
+	python benchmarks/bench_snapshot.py --links 1000000 --workers 4 --uri mongodb://localhost
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson.objectid import ObjectId
+import search
+import snapshot
+from bench_search import QUERIES, corpus, synthetic
+
+
+def memory():
+	fields = {}
+	with open("/proc/self/status") as f:
+		for line in f:
+			name, _, value = line.partition(":")
+			if name in ("VmRSS", "RssAnon", "RssFile"):
+				fields[name] = int(value.split()[0]) / 1024.0
+	return fields
+
+def replay(find, repeat):
+	latencies = []
+	for _ in range(repeat):
+		for query in QUERIES:
+			start = time.perf_counter()
+			find(query)
+			latencies.append(time.perf_counter() - start)
+	return latencies
+
+def worker(path, args, out):
+	if path == "mongo":
+		import pymongo
+		collection = pymongo.MongoClient(args.uri)[args.db]["links_%d" % args.links]
+		find = lambda query: search.find(collection, query)
+	else:
+		current = snapshot.Snapshot(path)
+		find = lambda query: current.find(query)
+	before = memory()
+	latencies = replay(find, args.repeat)
+	out.put((latencies, before, memory()))
+
+def measure(path, args):
+	out = multiprocessing.Queue()
+	processes = [multiprocessing.Process(target=worker, args=(path, args, out)) for _ in range(args.workers)]
+	for process in processes:
+		process.start()
+	results = [out.get() for process in processes]
+	for process in processes:
+		process.join()
+	latencies = sorted(latency for result in results for latency in result[0])
+	pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+	after = [result[2] for result in results]
+	print("%-8s p50 %7.3fms  p99 %7.3fms  per worker: rss %6.1fMB  own %6.1fMB  shared file %6.1fMB" % (
+		"mongo" if path == "mongo" else "snapshot", pick(0.5), pick(0.99),
+		statistics.mean(m["VmRSS"] for m in after), statistics.mean(m["RssAnon"] for m in after),
+		statistics.mean(m["RssFile"] for m in after)))
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--uri", help="MongoDB holding the bench_search corpus; without it only the snapshot is measured")
+	parser.add_argument("--db", default="benchlinks")
+	parser.add_argument("--links", type=int, default=1000000)
+	parser.add_argument("--workers", type=int, default=4)
+	parser.add_argument("--repeat", type=int, default=20)
+	parser.add_argument("--path", default="bench_links.snap")
+	args = parser.parse_args()
+
+	start = time.perf_counter()
+	if args.uri:
+		import pymongo
+		collection = pymongo.MongoClient(args.uri)[args.db]["links_%d" % args.links]
+		corpus(collection, args.links)
+		count = snapshot.rebuild(collection, args.path)
+	else:
+		count = snapshot.build((dict(doc, _id=ObjectId()) for doc in synthetic(0, args.links)), args.path)
+	print("snapshot: %d links, %.1fMB, built in %.1fs" % (count, os.path.getsize(args.path) / 1048576.0, time.perf_counter() - start))
+	measure(args.path, args)
+	if args.uri:
+		measure("mongo", args)
+
+if __name__ == '__main__':
+	main()
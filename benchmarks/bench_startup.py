@@ -0,0 +1,82 @@
+"""App startup time and Mongo connections held per worker.
+
+Startup: time for a fresh interpreter to import the Flask app, against
+an eager baseline that first runs what the old model.py ran at import
+(the Flask app imported nothing else): its imports and one MongoClient,
+which does not block. The old client always went to localhost, so the
+unreachable database run is timed for the lazy import only.
+
+Connections: starts --workers processes that import the app and serve a
+few searches, then reads connections.current from serverStatus. Needs a
+MongoDB reachable with the db.py settings.
+
+	python benchmarks/bench_startup.py --workers 4
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db
+
+LAZY = "import main"
+#the import-time statements of the old model.py, verbatim
+EAGER = """
+from bs4 import BeautifulSoup as soup
+import pymongo
+import requests
+import urllib.request
+dbmongo = pymongo.MongoClient(username="admin",password="root",authSource="admin")
+import main
+"""
+WORKER = """
+import sys, main
+client = main.app.test_client()
+for query in ("mp4", "cold", "harry potter"):
+	client.get("/searchAJAX", query_string={"search": query, "type": "all"})
+print("ready", flush=True)
+sys.stdin.read()
+"""
+
+
+def startup(code, env, repeat):
+	samples = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		subprocess.check_call([sys.executable, "-c", code], cwd=ROOT, env=env)
+		samples.append(time.perf_counter() - start)
+	return min(samples)
+
+def server_connections():
+	return db.mongo().admin.command("serverStatus")["connections"]["current"]
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--workers", type=int, default=4)
+	parser.add_argument("--repeat", type=int, default=5)
+	parser.add_argument("--unreachable", default="10.255.255.1", help="host used to show imports do not wait on the database")
+	args = parser.parse_args()
+
+	env = dict(os.environ)
+	print("import main, reachable db:   lazy %.3fs  eager %.3fs" % (startup(LAZY, env, args.repeat), startup(EAGER, env, args.repeat)))
+	env["MONGO_HOST"] = args.unreachable
+	print("import main, unreachable db: lazy %.3fs" % startup(LAZY, env, 1))
+
+	before = server_connections()
+	workers = [subprocess.Popen([sys.executable, "-c", WORKER], cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True) for _ in range(args.workers)]
+	try:
+		for worker in workers:
+			worker.stdout.readline()
+		held = server_connections() - before
+		print("%d workers hold %d connections, %.1f per worker" % (args.workers, held, held / args.workers))
+	finally:
+		for worker in workers:
+			worker.stdin.close()
+			worker.wait()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,53 @@
+"""Memory and false-positive rate of urlnorm.VisitedSet against a plain
+set of URL strings.
+
+False positives are counted by probing with URLs that were never added;
+with 64-bit fingerprints expect none until well past 10^9 URLs.
+
+	python benchmarks/bench_visited.py --urls 10000000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import urlnorm
+
+
+def url(i):
+	return "http://mirror%d.example.org/pub/linux/releases/%d/Everything/x86_64/os/Packages/%d/" % (i % 97, i % 40, i)
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--urls", type=int, default=2000000)
+	parser.add_argument("--probes", type=int, default=1000000)
+	parser.add_argument("--strings", action="store_true", help="also measure a set of strings (slow and large)")
+	args = parser.parse_args()
+
+	start = time.perf_counter()
+	visited = urlnorm.VisitedSet()
+	for i in range(args.urls):
+		visited.add(url(i))
+	elapsed = time.perf_counter() - start
+	#the table is the only allocation that grows; a resize briefly holds old and new
+	print("VisitedSet: %d urls in %.1fs, table %.1fMB (%.1f bytes/url), %.1fMB while resizing" % (
+		len(visited), elapsed, visited.nbytes() / 1e6, visited.nbytes() / len(visited), visited.nbytes() * 1.5 / 1e6))
+
+	start = time.perf_counter()
+	false = sum(1 for i in range(args.urls, args.urls + args.probes) if url(i) in visited)
+	print("false positives: %d of %d probes (%.2e), %.0f lookups/s" % (false, args.probes, false / args.probes, args.probes / (time.perf_counter() - start)))
+	missing = sum(1 for i in range(0, args.urls, max(1, args.urls // args.probes)) if url(i) not in visited)
+	assert missing == 0, "added url reported missing"
+
+	if args.strings:
+		tracemalloc.start()
+		plain = set(url(i) for i in range(args.urls))
+		current, peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		print("set of str: %d urls, %.1fMB (%.1f bytes/url)" % (len(plain), current / 1e6, current / len(plain)))
+
+if __name__ == '__main__':
+	main()
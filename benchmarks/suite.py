@@ -0,0 +1,250 @@
+"""End-to-end benchmark suite, results saved as JSON to compare commits.
+
+Three benchmarks, each through the code production runs:
+
+- crawl: model.Crawl over a generated autoindex tree served locally
+- etl: mongo.main over synthetic book_links rows loaded into MySQL
+- search: a query log replayed against /searchAJAX (the Flask test
+  client, so no web server is involved) over a synthetic links corpus
+
+Everything goes to scratch databases, the links database --database
+(default benchsuite, dropped before every repeat) and the MySQL database
+--mysql-database (default books_bench, created if missing); the usual
+MONGO_* and MYSQL_* settings from db.py say where the servers are. The
+suite refuses to use links, or the LINKS_DATABASE of its environment, as
+its scratch database. Inputs are generated from
+fixed seeds, so two runs with the same arguments do the same work.
+
+	python benchmarks/suite.py run --out before.json
+	git checkout other-branch
+	python benchmarks/suite.py run --out after.json
+	python benchmarks/suite.py compare before.json after.json
+
+A query log has one query a line, optionally followed by a tab and a type;
+without one a Zipf-skewed log is generated from the corpus words.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+#bench_etl imports mongo, whose collections take LINKS_DATABASE at import:
+#it is imported once main() has set the scratch database
+import bench_search
+from autoindex import Tree, serve
+
+SUITES = ("crawl", "etl", "search")
+#real links databases, never dropped
+PROTECTED = frozenset(name for name in ("links", os.environ.get("LINKS_DATABASE")) if name)
+#----------------------------------------------------------------------------------
+
+def git_state():
+	def git(*args):
+		try:
+			return subprocess.run(("git",) + args, cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+		except (OSError, subprocess.CalledProcessError):
+			return None
+	return {"commit": git("rev-parse", "HEAD"), "subject": git("log", "-1", "--format=%s"),
+		"dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+def summary(samples):
+	"""Median and spread of repeated measurements."""
+	ordered = sorted(samples)
+	return {"median": statistics.median(ordered), "min": ordered[0], "max": ordered[-1], "runs": len(ordered)}
+
+def percentiles(samples):
+	ordered = sorted(samples)
+	pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+	return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "mean": statistics.mean(ordered)}
+
+def drop_links_database():
+	import db
+	name = db.setting("LINKS_DATABASE", "links")
+	if name in PROTECTED:
+		raise RuntimeError("refusing to drop the %s database" % name)
+	db.mongo().drop_database(name)
+
+#----------------------------------------------------------------------------------
+
+def bench_crawl(args):
+	import crawler
+	import model
+	tree = Tree(args.depth, args.fanout, args.files, args.style)
+	server, base = serve(tree, latency=args.latency)
+	seconds = []
+	stages = {}
+	try:
+		for _ in range(args.repeat):
+			drop_links_database()
+			before = {key: counts[-1] for key, counts in crawler.STAGE_SECONDS.values.items()}
+			start = time.perf_counter()
+			result = model.Crawl(base, args.workers, args.workers, rate=None)
+			seconds.append(time.perf_counter() - start)
+			assert result.pages == tree.directories() and result.found == tree.links(), "incomplete crawl"
+			for key, counts in crawler.STAGE_SECONDS.values.items():
+				stages.setdefault(key[0], []).append(counts[-1] - before.get(key, 0.0))
+	finally:
+		server.shutdown()
+	elapsed = statistics.median(seconds)
+	return {"params": {"depth": args.depth, "fanout": args.fanout, "files": args.files, "style": args.style,
+			"latency": args.latency, "workers": args.workers},
+		"pages": tree.directories(), "links": tree.links(), "seconds": summary(seconds),
+		"pages_per_second": tree.directories() / elapsed, "links_per_second": tree.links() / elapsed,
+		"stage_seconds": {stage: statistics.median(values) for stage, values in stages.items()}}
+
+def load_book_links(count, database):
+	import bench_etl
+	import db
+	import pymysql
+	connect = {"host": db.setting("MYSQL_HOST", "localhost"), "user": db.setting("MYSQL_USER", "admin"),
+		"password": db.setting("MYSQL_PASSWORD", "root")}
+	conn = pymysql.connect(**connect)
+	try:
+		with conn.cursor() as cursor:
+			cursor.execute("CREATE DATABASE IF NOT EXISTS `%s`" % database)
+			cursor.execute("USE `%s`" % database)
+			cursor.execute("CREATE TABLE IF NOT EXISTS book_links (id int(11) NOT NULL PRIMARY KEY, book_name varchar(255), book_link varchar(7000))")
+			cursor.execute("SELECT COUNT(*) FROM book_links")
+			if cursor.fetchone()[0] != count:
+				cursor.execute("TRUNCATE book_links")
+				rows = bench_etl.rows(count)
+				for i in range(0, count, 10000):
+					cursor.executemany("INSERT INTO book_links (id, book_name, book_link) VALUES (%s, %s, %s)", rows[i:i + 10000])
+		conn.commit()
+	finally:
+		conn.close()
+
+def bench_etl_run(args):
+	os.environ["MYSQL_DATABASE"] = args.mysql_database
+	load_book_links(args.rows, args.mysql_database)
+	import mongo
+	results = {}
+	for workers in args.etl_workers:
+		seconds = []
+		for _ in range(args.repeat):
+			drop_links_database()
+			with tempfile.TemporaryDirectory() as scratch:
+				start = time.perf_counter()
+				links, last = mongo.main(args.batch_size, workers, os.path.join(scratch, "num"))
+				seconds.append(time.perf_counter() - start)
+			assert last == args.rows, "ETL stopped at id %s" % last
+		results[str(workers)] = {"seconds": summary(seconds), "rows_per_second": args.rows / statistics.median(seconds)}
+	return {"params": {"rows": args.rows, "batch_size": args.batch_size}, "workers": results}
+
+def query_log(path, count, seed=5):
+	if path:
+		with open(path, encoding="utf-8") as f:
+			lines = [line.rstrip("\n").split("\t") for line in f if line.strip()]
+		return [(parts[0], parts[1] if len(parts) > 1 else "all") for parts in lines]
+	rnd = random.Random(seed)
+	words = bench_search.WORDS
+	#a few queries are asked far more often than the rest, like a real log
+	weights = [1.0 / (rank + 1) for rank in range(len(words))]
+	log = []
+	for _ in range(count):
+		terms = rnd.choices(words, weights, k=rnd.choice((1, 1, 2)))
+		log.append((" ".join(terms), rnd.choice(("all", "all", "all", "video", "audio", "text"))))
+	return log
+
+def bench_search_run(args):
+	import main as app_module
+	import model
+	drop_links_database()
+	bench_search.corpus(model.LinksLinksCollection.resolve(), args.links)
+	log = query_log(args.query_log, args.queries)
+	client = app_module.app.test_client()
+	latencies = []
+	start = time.perf_counter()
+	for query, linkType in log:
+		began = time.perf_counter()
+		client.get("/searchAJAX", query_string={"search": query, "type": linkType})
+		latencies.append((time.perf_counter() - began) * 1000)
+	elapsed = time.perf_counter() - start
+	stats = model.queryCache.stats()
+	return {"params": {"links": args.links, "queries": len(log), "query_log": args.query_log},
+		"latency_ms": percentiles(latencies), "queries_per_second": len(log) / elapsed, "cache_hit_rate": stats["hit_rate"]}
+
+#----------------------------------------------------------------------------------
+
+def run(args):
+	report = {"git": git_state(), "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "python": platform.python_version(),
+		"platform": platform.platform(), "results": {}}
+	runners = {"crawl": bench_crawl, "etl": bench_etl_run, "search": bench_search_run}
+	for name in args.only:
+		print("running", name, file=sys.stderr)
+		#progress output of the code under test stays off the JSON on stdout
+		with contextlib.redirect_stdout(sys.stderr):
+			report["results"][name] = runners[name](args)
+	text = json.dumps(report, indent=2, sort_keys=True)
+	if args.out:
+		with open(args.out, "w") as f:
+			f.write(text + "\n")
+	print(text)
+
+def flatten(value, prefix=""):
+	if isinstance(value, dict):
+		flat = {}
+		for key, item in value.items():
+			flat.update(flatten(item, prefix + "." + key if prefix else key))
+		return flat
+	return {prefix: value} if isinstance(value, (int, float)) and not isinstance(value, bool) else {}
+
+def compare(args):
+	with open(args.before) as f:
+		before = json.load(f)
+	with open(args.after) as f:
+		after = json.load(f)
+	print("%s -> %s" % ((before["git"]["commit"] or "?")[:10], (after["git"]["commit"] or "?")[:10]))
+	old = flatten(before["results"])
+	new = flatten(after["results"])
+	for key in sorted(set(old) & set(new)):
+		if ".params." in "." + key or key.endswith((".runs", ".pages", ".links")):
+			continue
+		change = (new[key] - old[key]) / old[key] * 100 if old[key] else float("nan")
+		print("%-50s %12.4g %12.4g %+8.1f%%" % (key, old[key], new[key], change))
+
+def main():
+	parser = argparse.ArgumentParser(description="end-to-end crawl, ETL and search benchmarks")
+	commands = parser.add_subparsers(dest="command", required=True)
+	runner = commands.add_parser("run")
+	runner.add_argument("--only", nargs="+", choices=SUITES, default=list(SUITES))
+	runner.add_argument("--out", help="write the JSON report here as well as to stdout")
+	runner.add_argument("--repeat", type=int, default=3)
+	runner.add_argument("--depth", type=int, default=3)
+	runner.add_argument("--fanout", type=int, default=5)
+	runner.add_argument("--files", type=int, default=30)
+	runner.add_argument("--style", choices=("apache", "nginx"), default="apache")
+	runner.add_argument("--latency", type=float, default=0.01, help="seconds added to every crawled response")
+	runner.add_argument("--workers", type=int, default=16, help="crawler threads")
+	runner.add_argument("--rows", type=int, default=200000, help="book_links rows for the ETL")
+	runner.add_argument("--batch-size", type=int, default=5000)
+	runner.add_argument("--etl-workers", type=int, nargs="+", default=[1, 4])
+	runner.add_argument("--database", default="benchsuite", help="scratch links database, dropped before every repeat")
+	runner.add_argument("--mysql-database", default="books_bench")
+	runner.add_argument("--links", type=int, default=200000, help="links in the search corpus")
+	runner.add_argument("--queries", type=int, default=2000, help="length of the generated query log")
+	runner.add_argument("--query-log", help="replay this log instead of a generated one")
+	comparer = commands.add_parser("compare")
+	comparer.add_argument("before")
+	comparer.add_argument("after")
+	args = parser.parse_args()
+	if args.command == "run":
+		if args.database in PROTECTED:
+			parser.error("--database %s holds real links, pick a scratch database" % args.database)
+		os.environ["LINKS_DATABASE"] = args.database
+		run(args)
+	else:
+		compare(args)
+
+if __name__ == '__main__':
+	main()
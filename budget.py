@@ -0,0 +1,80 @@
+"""Per-seed crawl budgets.
+
+Every directory is charged to the seed it was found under (the longest
+seed that is a prefix of its url; a url under no known seed, as after a
+resume, to the root of its host). A seed stops being crawled once it used
+up max_pages pages, max_links links or max_seconds since it started;
+max_depth and max_subdirs bound the tree itself, the way
+scripts/github-crawler.js does with MAX_DEPTH and MAX_SUBDIRS_PER_LEVEL.
+None means no limit. Limits are checked as pages are taken from the
+frontier, so max_links and max_seconds can be overshot by the pages
+already in flight. Budgets are kept per crawler process, so workers
+sharing a frontier each spend their own.
+"""
+from urllib.parse import urlsplit
+
+
+class Spend(object):
+	__slots__ = ("pages", "links", "started")
+
+	def __init__(self, started):
+		self.pages = 0
+		self.links = 0
+		self.started = started
+
+class Budget(object):
+
+	def __init__(self, max_depth=None, max_subdirs=None, max_pages=None, max_links=None, max_seconds=None):
+		self.max_depth = max_depth
+		self.max_subdirs = max_subdirs
+		self.max_pages = max_pages
+		self.max_links = max_links
+		self.max_seconds = max_seconds
+		self.seeds = {}
+		#distinct seed lengths, longest first: seed_of looks up one prefix of
+		#the url per length, however many seeds (--retry-errors makes thousands)
+		self.lengths = []
+		self.cut = 0
+
+	def add_seed(self, seed, now):
+		if seed not in self.seeds:
+			self.seeds[seed] = Spend(now)
+			if len(seed) not in self.lengths:
+				self.lengths.append(len(seed))
+				self.lengths.sort(reverse=True)
+
+	def seed_of(self, url, now):
+		best = None
+		for length in self.lengths:
+			if length <= len(url) and url[:length] in self.seeds:
+				best = url[:length]
+				break
+		if best is None:
+			parts = urlsplit(url)
+			best = "%s://%s/" % (parts.scheme, parts.netloc)
+			self.add_seed(best, now)
+		return best
+
+	def subdirs(self, urls, depth):
+		"""The subdirectories of a page at depth worth queueing."""
+		if self.max_depth is not None and depth >= self.max_depth:
+			self.cut += len(urls)
+			return []
+		if self.max_subdirs is not None and len(urls) > self.max_subdirs:
+			self.cut += len(urls) - self.max_subdirs
+			return urls[:self.max_subdirs]
+		return urls
+
+	def admit(self, url, now):
+		"""Charge a page to its seed; False when the seed is out of budget."""
+		spend = self.seeds[self.seed_of(url, now)]
+		if ((self.max_pages is not None and spend.pages >= self.max_pages)
+				or (self.max_links is not None and spend.links >= self.max_links)
+				or (self.max_seconds is not None and now - spend.started >= self.max_seconds)):
+			self.cut += 1
+			return False
+		spend.pages += 1
+		return True
+
+	def found(self, url, links, now):
+		self.seeds[self.seed_of(url, now)].links += links
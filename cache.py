@@ -0,0 +1,243 @@
+"""Result cache in front of getList.
+
+Entries are keyed on (normalised terms, type, page cursor, page size) and
+evicted least recently used beyond maxsize, or after ttl seconds.
+
+Three ways to drop stale results when new links are written:
+
+- invalidate(tokens) drops entries whose terms all prefix-match one of the
+  new tokens, for writers running in the same process
+- the same for writers in other processes: after a flush they publish the
+  tokens they wrote to links.changes (publish_changes), and a ChangeFeed
+  hands them to the cache at most every check_interval seconds. Keyset
+  pages only gain links, so results of other terms stay good
+- a generation counter in the links.meta collection, bumped after bulk
+  imports (dump.py); the cache starts over when it moved
+
+A lookup racing a writer could cache what it read before the write after
+the write invalidated: callers take version() before the lookup and pass
+it to put(), which drops the result if anything was invalidated since.
+
+SingleFlight covers the misses: when a query trends, the requests that
+arrive while its first lookup is still running wait for that lookup
+instead of sending the same query to Mongo again.
+"""
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime, timezone
+import threading
+import time
+import pymongo
+
+
+def read_generation(meta):
+	doc = meta.find_one({"_id":"generation"})
+	return doc["value"] if doc else 0
+
+def bump_generation(meta):
+	meta.update_one({"_id":"generation"},{"$inc":{"value":1}},upsert=True)
+
+def publish_changes(meta, changes, tokens):
+	"""Record the tokens of links just written for the caches of other
+	processes, under the next number of the links.meta "changes" counter."""
+	tokens = sorted(set(tokens))
+	if not tokens:
+		return
+	number = meta.find_one_and_update({"_id":"changes"},{"$inc":{"value":1}},upsert=True,
+		return_document=pymongo.ReturnDocument.AFTER)["value"]
+	changes.insert_one({"_id":number,"tokens":tokens,"at":datetime.now(timezone.utc)})
+
+class ChangeFeed(object):
+	"""Tokens published by publish_changes since the last read.
+
+	Numbers are taken before the insert, so two writers can land out of
+	order: the last overlap numbers are read again and the ones already
+	handed out skipped. Changes expire from the collection after ttl
+	seconds. The first read starts at the current counter."""
+
+	def __init__(self, meta, changes, overlap=64, ttl=3600):
+		self.meta = meta
+		self.changes = changes
+		self.overlap = overlap
+		self.ttl = ttl
+		self.last = None
+		self.seen = set()
+		self.lock = threading.Lock()
+
+	def __call__(self):
+		with self.lock:
+			return self._read()
+
+	def _read(self):
+		if self.last is None:
+			self.changes.create_index([("at", pymongo.ASCENDING)], expireAfterSeconds=self.ttl)
+			doc = self.meta.find_one({"_id":"changes"})
+			self.last = doc["value"] if doc else 0
+			return []
+		tokens = []
+		for doc in self.changes.find({"_id":{"$gt":self.last - self.overlap}}).sort("_id", pymongo.ASCENDING):
+			if doc["_id"] in self.seen:
+				continue
+			self.seen.add(doc["_id"])
+			self.last = max(self.last, doc["_id"])
+			tokens += doc["tokens"]
+		self.seen = set(number for number in self.seen if number > self.last - self.overlap)
+		return tokens
+
+#----------------------------------------------------------------------------------
+
+class QueryCache(object):
+
+	def __init__(self, maxsize=1024, ttl=300.0, generation=None, check_interval=1.0, changes=None):
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self.generation = generation
+		self.changes = changes
+		self.check_interval = check_interval
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+		self.current = None
+		self.checked = 0.0
+		#bumped by every invalidation, see version()
+		self.invalidations = 0
+		self.counters = {"hits":0,"misses":0,"evictions":0,"expired":0,"invalidated":0,"generations":0}
+
+	def _check_generation(self, now):
+		if (self.generation is None and self.changes is None) or now - self.checked < self.check_interval:
+			return
+		self.checked = now
+		try:
+			tokens = self.changes() if self.changes is not None else None
+			generation = self.generation() if self.generation is not None else None
+		except Exception:
+			#a cache that cannot see the database keeps serving until ttl
+			return
+		if tokens:
+			self.invalidate(tokens)
+		with self.lock:
+			if generation != self.current:
+				if self.current is not None:
+					self.invalidations += 1
+					self.counters["generations"] += 1
+					self.counters["invalidated"] += len(self.entries)
+					self.entries.clear()
+				self.current = generation
+
+	def get(self, key):
+		now = time.monotonic()
+		self._check_generation(now)
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is None:
+				self.counters["misses"] += 1
+				return None
+			if now - entry[0] > self.ttl:
+				del self.entries[key]
+				self.counters["expired"] += 1
+				self.counters["misses"] += 1
+				return None
+			self.entries.move_to_end(key)
+			self.counters["hits"] += 1
+			return entry[1]
+
+	def version(self):
+		"""Changes when entries are invalidated; pass it to put()."""
+		with self.lock:
+			return self.invalidations
+
+	def put(self, key, value, version=None):
+		"""Cache value, unless entries were invalidated since version()
+		returned version: value may predate the links that invalidated them."""
+		with self.lock:
+			if version is not None and version != self.invalidations:
+				return
+			self.entries[key] = (time.monotonic(), value)
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.maxsize:
+				self.entries.popitem(last=False)
+				self.counters["evictions"] += 1
+
+	def invalidate(self, tokens):
+		"""Drop cached queries that documents with these tokens could match.
+		Keys start with the tuple of query terms."""
+		tokens = sorted(set(tokens))
+		def matches(term):
+			i = bisect_left(tokens, term)
+			return i < len(tokens) and tokens[i].startswith(term)
+		with self.lock:
+			self.invalidations += 1
+			stale = [key for key in self.entries if all(matches(term) for term in key[0])]
+			for key in stale:
+				del self.entries[key]
+			self.counters["invalidated"] += len(stale)
+		return len(stale)
+
+	def clear(self):
+		with self.lock:
+			self.invalidations += 1
+			self.entries.clear()
+
+	def stats(self):
+		with self.lock:
+			stats = dict(self.counters)
+			stats["size"] = len(self.entries)
+		stats["maxsize"] = self.maxsize
+		stats["ttl"] = self.ttl
+		lookups = stats["hits"] + stats["misses"]
+		stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+		return stats
+
+#----------------------------------------------------------------------------------
+
+class Flight(object):
+	__slots__ = ("done", "result", "error")
+
+	def __init__(self):
+		self.done = threading.Event()
+		self.result = None
+		self.error = None
+
+class SingleFlight(object):
+	"""Concurrent calls with the same key share one call of the function."""
+
+	def __init__(self):
+		self.flights = {}
+		self.lock = threading.Lock()
+		self.counters = {"calls":0,"shared":0,"timeouts":0}
+
+	def do(self, key, function, timeout=None):
+		"""function() for the first caller with key, its result (or error)
+		for everyone asking while it runs. A waiter giving up after timeout
+		seconds gets TimeoutError; the call itself carries on."""
+		with self.lock:
+			flight = self.flights.get(key)
+			leader = flight is None
+			if leader:
+				flight = self.flights[key] = Flight()
+				self.counters["calls"] += 1
+			else:
+				self.counters["shared"] += 1
+		if leader:
+			try:
+				flight.result = function()
+			except BaseException as error:
+				flight.error = error
+				raise
+			finally:
+				with self.lock:
+					del self.flights[key]
+				flight.done.set()
+			return flight.result
+		if not flight.done.wait(timeout):
+			with self.lock:
+				self.counters["timeouts"] += 1
+			raise TimeoutError("waited %.1fs for a shared call" % timeout)
+		if flight.error is not None:
+			raise flight.error
+		return flight.result
+
+	def stats(self):
+		with self.lock:
+			stats = dict(self.counters)
+			stats["in_flight"] = len(self.flights)
+		return stats
@@ -0,0 +1,56 @@
+"""File type of a link from its extension.
+
+One dict lookup per URL (two for compound extensions like tar.gz) instead
+of the old chains of endswith() tests. Differences from the old chains,
+all bug fixes:
+
+- only a real extension matches: "thai", "example.com" and "cabin" used
+  to classify as image, executable and disk because "ai", "com" and "bin"
+  were matched as bare suffixes of the whole URL; text without a "." in
+  its last segment ("mp4") or with another scheme than http(s)
+  ("mailto:me@example.com") is no file either
+- the query string and fragment are ignored, "a.mp4?dl=1" is a video
+- mongo.main wrote "executeable", it is "executable" everywhere now
+"""
+
+TYPES = {
+	"video": ("mp4","mkv","3gp","avi","mov","mpg","mpeg","wmv","m4v"),
+	"audio": ("mp3","aif","mid","midi","mpa","ogg","wav","wma","wpl"),
+	"compressed": ("rar","zip","deb","pkg","tar.gz","z","rpm","7z","arj"),
+	"disk": ("bin","dmg","iso","toast","vcd"),
+	"executable": ("exe","apk","bat","com","jar","py","wsf"),
+	"image": ("ai","bmp","gif","ico","jpeg","png","jpg","tif","svg"),
+	"text": ("pdf","txt","doc","rtf","wpd","docx","odt","wps","wks"),
+}
+
+EXTENSIONS = dict((extension, linkType) for linkType, extensions in TYPES.items() for extension in extensions)
+#----------------------------------------------------------------------------------
+
+#last extension of a compound one, e.g. "gz" for "tar.gz"
+COMPOUND = frozenset(extension.rsplit(".", 1)[1] for extension in EXTENSIONS if "." in extension)
+SCHEMES = ("http", "https")
+
+def classify(url, lookup=EXTENSIONS.get):
+	"""Type of the file url points at, or None when it is not one we keep."""
+	if "?" in url or "#" in url:
+		url = url.split("?", 1)[0].split("#", 1)[0]
+	colon = url.find(":")
+	if colon >= 0 and url[:colon].lower() not in SCHEMES and "/" not in url[:colon]:
+		#mailto:, ftp:, javascript: and the like
+		return None
+	slash = url.rfind("/")
+	dot = url.rfind(".")
+	if dot <= slash or url[slash - 2:slash + 1] == "://":
+		#no extension, or a bare host like http://example.com
+		return None
+	extension = url[dot + 1:].lower()
+	linkType = lookup(extension)
+	if linkType is None and extension in COMPOUND:
+		dot = url.rfind(".", slash + 1, dot)
+		if dot >= 0:
+			linkType = lookup(url[dot + 1:].lower())
+	return linkType
+
+def classify_all(urls):
+	"""classify() over a whole page of links, in order."""
+	return list(map(classify, urls))
@@ -0,0 +1,174 @@
+"""Search-as-you-type completions from the words of link names.
+
+PrefixIndex keeps every word of every link name (search.tokenize, one
+count a link) in a sorted list. The words starting with a prefix are the
+slice bisect finds, so a completion costs two binary searches plus a pick
+of the k most frequent in the slice. Short prefixes have slices too long
+to rank per keystroke: their top words are kept ready and updated as
+counts grow, never recomputed.
+
+A batch of new words is merged into a copy of the list, and the top lists
+it changes are copied, outside the lock; the lock only swaps them in, so
+a completion never waits on a refresh.
+
+Completions is the index of a links collection. It loads every name on
+first use and then only the links with a higher _id, every
+refresh_interval seconds, so links a crawler inserts show up without a
+rebuild. Loads run on a background thread and searches never wait on
+them: until the first one is done there are no completions. Links
+imported with older _ids (dump.py) are only seen after a restart.
+"""
+from bisect import bisect_left, insort
+import heapq
+import threading
+import time
+import pymongo
+import search
+
+
+#slices longer than this get their top words kept, shorter ones are ranked per call
+SCAN = 256
+#----------------------------------------------------------------------------------
+
+def name_words(doc):
+	#digits only and single letters are no help to complete to
+	return set(word for word in search.tokenize(doc.get("name") or "") if len(word) > 1 and not word.isdigit())
+
+class PrefixIndex(object):
+	"""Sorted words with the number of link names each is in."""
+
+	def __init__(self, keep=20):
+		self.keep = keep
+		self.words = []
+		self.counts = {}
+		#prefix -> the keep most frequent words under it, as sorted (-count, word)
+		self.top = {}
+		self.longest = 0
+		#lock guards swapping words and top; adding holds adding
+		self.lock = threading.Lock()
+		self.adding = threading.Lock()
+
+	def __len__(self):
+		return len(self.words)
+
+	def add(self, docs):
+		"""Count the name words of more link documents."""
+		grown = {}
+		for doc in docs:
+			for word in name_words(doc):
+				grown[word] = grown.get(word, 0) + 1
+		if not grown:
+			return
+		with self.adding:
+			new = sorted(word for word in grown if word not in self.counts)
+			#counts only grow, a completion reading a newer count is harmless
+			for word, count in grown.items():
+				self.counts[word] = self.counts.get(word, 0) + count
+			#merged by slices: one sort of the whole list would hold the GIL
+			#for its string compares, a slice copy only increfs
+			words, start = [], 0
+			for word in new:
+				at = bisect_left(self.words, word, start)
+				words.extend(self.words[start:at])
+				words.append(word)
+				start = at
+			words.extend(self.words[start:])
+			with self.lock:
+				top = dict(self.top)
+			changed = {}
+			for word in grown:
+				self._promote(word, top, changed)
+			with self.lock:
+				#prefixes a completion kept meanwhile are dropped, the next one keeps them again
+				self.words, self.top = words, top
+
+	def _promote(self, word, top, changed):
+		#counts only grow: a word joins or moves up the lists of its prefixes;
+		#a list is copied the first time it changes, completions may be reading it
+		entry = (-self.counts[word], word)
+		for end in range(1, min(len(word), self.longest) + 1):
+			prefix = word[:end]
+			kept = top.get(prefix)
+			if kept is None:
+				continue
+			if prefix not in changed:
+				kept = top[prefix] = changed[prefix] = list(kept)
+			for i, (count, other) in enumerate(kept):
+				if other == word:
+					del kept[i]
+					break
+			if len(kept) < self.keep or entry < kept[-1]:
+				insort(kept, entry)
+				del kept[self.keep:]
+
+	def complete(self, prefix, k=10):
+		"""[(word, count)] for the k most frequent words starting with prefix."""
+		prefix = prefix.lower()
+		with self.lock:
+			words, tops = self.words, self.top
+			top = tops.get(prefix)
+		if top is None:
+			start = bisect_left(words, prefix)
+			end = bisect_left(words, prefix + "\U0010ffff", start)
+			if end - start > SCAN or k > self.keep:
+				top = heapq.nsmallest(max(k, self.keep), ((-self.counts[word], word) for word in words[start:end]))
+				with self.lock:
+					#not if a batch was swapped in meanwhile, top may miss its words
+					if k <= self.keep and self.top is tops:
+						self.top[prefix] = top
+						self.longest = max(self.longest, len(prefix))
+			else:
+				top = sorted((-self.counts[word], word) for word in words[start:end])
+		return [(word, -count) for count, word in top[:k]]
+
+#----------------------------------------------------------------------------------
+
+class Completions(object):
+	"""PrefixIndex of a links collection, kept up with the links inserted."""
+
+	def __init__(self, collection, refresh_interval=10.0, batch_size=10000):
+		self.collection = collection
+		self.refresh_interval = refresh_interval
+		self.batch_size = batch_size
+		self.index = PrefixIndex()
+		self.last = None
+		self.loaded = 0
+		self.checked = None
+		self.loading = False
+		self.lock = threading.Lock()
+
+	def refresh(self):
+		"""Add the links inserted since the last refresh."""
+		query = {"_id":{"$gt":self.last}} if self.last is not None else {}
+		batch = []
+		for doc in self.collection.find(query, {"name":1}, batch_size=self.batch_size).sort("_id", pymongo.ASCENDING):
+			batch.append(doc)
+			if len(batch) == self.batch_size:
+				self._add(batch)
+				batch = []
+		if batch:
+			self._add(batch)
+
+	def _add(self, docs):
+		self.index.add(docs)
+		self.last = docs[-1]["_id"]
+		self.loaded += len(docs)
+
+	def _load(self):
+		try:
+			self.refresh()
+		finally:
+			with self.lock:
+				self.loading = False
+				self.checked = time.monotonic()
+
+	def complete(self, prefix, k=10):
+		with self.lock:
+			due = self.checked is None or time.monotonic() - self.checked >= self.refresh_interval
+			if due and not self.loading:
+				self.loading = True
+				threading.Thread(target=self._load, name="completions", daemon=True).start()
+		return self.index.complete(prefix, k)
+
+	def stats(self):
+		return {"words":len(self.index),"links":self.loaded,"prefixes_kept":len(self.index.top),"loading":self.loading}
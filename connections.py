@@ -1,11 +1,10 @@
-import pymongo
-import pymysql as mysqldb
+import db
 
+#kept for older scripts: the same names, connecting on first use (see db.py)
+MongoDB = db.Lazy(db.mongo)
+TestdbStudentsCollection = db.collection("testdb","students")
+TestdbUrlsCollection = db.collection("testdb","urls")
 
-MongoDB = pymongo.MongoClient(username="admin",password="root",authSource="admin")
-TestdbStudentsCollection = MongoDB.testdb.students
-TestdbUrlsCollection = MongoDB.testdb.urls
-
-
-MySqlDB=mysqldb.connect("localhost","admin","root","books")
-MySqlCursor = MySqlDB.cursor()
+#a cursor keeps its connection, so it gets one of its own and not a pooled one
+MySqlDB = db.Lazy(db.mysql_connect)
+MySqlCursor = db.Lazy(lambda: MySqlDB.cursor())
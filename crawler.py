@@ -0,0 +1,300 @@
+from collections import deque
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlsplit
+import classifier
+import fetcher
+import listing
+import metrics
+import urlnorm
+from budget import Budget
+from fetchcache import digest
+from frontier import MemoryFrontier, PriorityFrontier
+from politeness import HostScheduler, classify_failure
+
+STAGE_SECONDS = metrics.histogram("crawl_stage_seconds", "Time spent per page in each crawl stage", ["stage"])
+PAGE_BYTES = metrics.counter("crawl_bytes_total", "Bytes of listing pages fetched")
+PAGES = metrics.counter("crawl_pages_total", "Listing pages finished, by outcome", ["result"])
+LINKS = metrics.counter("crawl_links_total", "Classified links found")
+ERRORS = metrics.counter("crawl_errors_total", "Failed fetches (retried or not) by HTTP status or exception class", ["error"])
+QUEUE_DEPTH = metrics.gauge("crawl_queue_depth", "Directories waiting in each crawler queue", ["queue"])
+PAGE_RATE = metrics.gauge("crawl_pages_per_second", "Pages finished a second since the crawl started, as of the last checkpoint")
+#----------------------------------------------------------------------------------
+
+def error_class(exc):
+	status = classify_failure(exc)[1]
+	return "http_%d" % status if status is not None else type(exc).__name__
+
+def parse(url, page_html):
+	"""Split a directory index page into (subdirectory urls, link documents).
+
+	url must be canonical; only directories below it are followed, so
+	parent links, sort links and links back into the tree are dropped."""
+	subdirs = []
+	files = []
+	with STAGE_SECONDS.time(stage="parse"):
+		for href, text in listing.extract_links(page_html):
+			fullLink = urlnorm.canonical(url, href)
+			if fullLink.endswith("/"):
+				if urlnorm.is_child(url, fullLink):
+					subdirs.append(fullLink)
+			else:
+				files.append((text, fullLink))
+	with STAGE_SECONDS.time(stage="classify"):
+		types = classifier.classify_all([fullLink for text, fullLink in files])
+	dirLink = [{"name":text,"link":fullLink,"type":linkType} for (text, fullLink), linkType in zip(files, types) if linkType is not None]
+	return subdirs, dirLink
+
+#----------------------------------------------------------------------------------
+
+class Crawler(object):
+	"""Iterative crawler for open directory indexes.
+
+	Directories wait in a frontier (frontier.py, FIFO in memory unless a
+	durable or shared one is passed; with a shared one the crawl ends when
+	no worker holds any more pages) and are fetched by a thread pool, with at most
+	max_workers requests in flight overall. Which host goes next is up to a
+	politeness.HostScheduler: per_host requests in flight and rate requests
+	a second per host at most, with 429/5xx and connection failures retried
+	max_retries times after a backoff before they are recorded as errors.
+	Parsing happens on the worker threads; results go to a writer.LinkWriter
+	on the calling thread, which is flushed before the frontier commits
+	every checkpoint_every pages. Pages are only marked done or failed in
+	the frontier, and recorded in the fetch cache, once a flush has written
+	their results, and writer errors end the crawl, so a resumed or
+	incremental crawl fetches again whatever was not stored.
+
+	With a fetchcache.FetchCache the crawl is incremental: pages are
+	requested conditionally, a page answering 304 or with an unchanged body
+	is not parsed or written again and its subtree is skipped (or only
+	revalidated, with recheck_subtrees).
+
+	A budget.Budget bounds the crawl per seed. With a frontier that orders
+	by score, subdirectories of pages with the most classified links are
+	fetched first, so a run cut short by its budget has the richest
+	directories.
+	"""
+
+	def __init__(self, writer, max_workers=16, per_host=4, fetch=fetcher.fetch,
+			cache=None, revalidate=fetcher.revalidate, recheck_subtrees=False,
+			frontier=None, checkpoint_every=100, rate=None, max_retries=4, budget=None):
+		self.writer = writer
+		self.frontier = frontier if frontier is not None else MemoryFrontier()
+		self.hosts = HostScheduler(per_host=per_host, rate=rate, max_retries=max_retries)
+		self.budget = budget if budget is not None else Budget()
+		self.checkpoint_every = checkpoint_every
+		self.visited = urlnorm.VisitedSet()
+		self.delayed = []
+		#(url, state, fetch cache record) of pages whose results wait for the next flush
+		self.settled = []
+		#urls fetched while recrawl() runs
+		self.fetched = None
+		self.max_workers = max_workers
+		self.fetch = fetch
+		self.cache = cache
+		self.revalidate = revalidate
+		self.recheck_subtrees = recheck_subtrees
+		self.pages = 0
+		self.found = 0
+		self.failed = 0
+		self.skipped = 0
+		self.refetched = 0
+		self.started = time.monotonic()
+
+	def _visit(self, url):
+		if self.cache is None:
+			with STAGE_SECONDS.time(stage="fetch"):
+				page_html = self.fetch(url)
+			PAGE_BYTES.inc(len(page_html))
+			subdirs, dirLink = parse(url, page_html)
+			return subdirs, dirLink, None
+		previous = self.cache.get(url)
+		with STAGE_SECONDS.time(stage="fetch"):
+			if previous is None:
+				page_html, etag, lastModified = self.revalidate(url)
+			else:
+				page_html, etag, lastModified = self.revalidate(url, previous.get("etag"), previous.get("lastModified"))
+		page = {"previous":previous,"etag":etag,"lastModified":lastModified,"unchanged":page_html is None}
+		if page_html is not None:
+			PAGE_BYTES.inc(len(page_html))
+			page["hash"] = digest(page_html)
+			page["unchanged"] = previous is not None and previous.get("hash") == page["hash"]
+		if page["unchanged"]:
+			return None, None, page
+		subdirs, dirLink = parse(url, page_html)
+		return subdirs, dirLink, page
+
+	def _next(self, window, now):
+		"""First queued (url, depth, attempt) whose host may be sent a request
+		now, and the earliest time a host with a free slot gets ready."""
+		wake = None
+		for i in range(len(window)):
+			host = urlsplit(window[i][0]).netloc
+			ready = self.hosts.ready_at(host, now)
+			if ready is None:
+				continue
+			if ready <= now:
+				item = window[i]
+				del window[i]
+				return item, host, wake
+			wake = ready if wake is None else min(wake, ready)
+		return None, None, wake
+
+	def _store(self, url, dirLink):
+		if dirLink:
+			with STAGE_SECONDS.time(stage="write"):
+				self.writer.add_links(dirLink)
+				self.writer.add_url(url)
+			self.found += len(dirLink)
+			LINKS.inc(len(dirLink))
+			self.budget.found(url, len(dirLink), time.monotonic())
+		self.pages += 1
+		PAGES.inc(result="stored")
+
+	def _unchanged(self, url, depth, page):
+		previous = page["previous"]
+		self.skipped += 1
+		PAGES.inc(result="unchanged")
+		cached = None
+		if (page["etag"], page["lastModified"]) != (previous.get("etag"), previous.get("lastModified")):
+			cached = (page["etag"], page["lastModified"], previous["hash"], previous["subdirs"])
+		self.settled.append((url, "done", cached))
+		if self.recheck_subtrees:
+			self._enqueue(self.budget.subdirs(previous["subdirs"], depth), depth + 1)
+
+	def _error(self, url):
+		self.writer.add_error(url)
+		self.settled.append((url, "failed", None))
+		self.failed += 1
+		PAGES.inc(result="failed")
+		print("ERROR:"+url)
+
+	def _finish(self, url, depth, attempt, host, future):
+		if self.fetched is not None:
+			self.fetched.add(url)
+		try:
+			subdirs, dirLink, page = future.result()
+		except Exception as exc:
+			ERRORS.inc(error=error_class(exc))
+			delay = self.hosts.failed(host, attempt, exc, time.monotonic())
+			if delay is None:
+				self._error(url)
+			else:
+				#still inflight in the frontier, a resumed crawl picks it up
+				heapq.heappush(self.delayed, (time.monotonic() + delay, url, depth, attempt + 1))
+			return
+		self.hosts.succeeded(host)
+		#storage errors are not the page's fault: they end the crawl
+		if page is not None and page["unchanged"]:
+			self._unchanged(url, depth, page)
+			return
+		self._store(url, dirLink)
+		cached = None
+		if page is not None:
+			#an unchanged hash skips the page and its subtree, so it waits for the links too
+			cached = (page["etag"], page["lastModified"], page["hash"], subdirs)
+			self.refetched += page["previous"] is not None
+		#a page full of files makes its subdirectories worth fetching early
+		self._enqueue(self.budget.subdirs(subdirs, depth), depth + 1, len(dirLink))
+		self.settled.append((url, "done", cached))
+
+	def _enqueue(self, urls, depth, score=0):
+		#symlink loops and self links end here, each directory is queued once
+		self.frontier.add([(url, depth) for url in urls if self.visited.add(url)], score)
+
+	def _admit(self, items):
+		admitted = []
+		now = time.monotonic()
+		for url, depth in items:
+			if self.budget.admit(url, now):
+				admitted.append((url, depth, 0))
+			else:
+				#out of budget, not an error: a resume or a worker with budget left may take it
+				self.frontier.cut(url)
+		return admitted
+
+	def _checkpoint(self):
+		#results first, so no page is marked done before its links are stored
+		with STAGE_SECONDS.time(stage="checkpoint"):
+			self.writer.flush()
+			settled, self.settled = self.settled, []
+			for url, state, cached in settled:
+				if state == "done":
+					self.frontier.done(url)
+				else:
+					self.frontier.failed(url)
+			self.frontier.commit()
+			#after the commit that queued their subdirectories: a page the cache
+			#calls unchanged has its subtree skipped
+			for url, state, cached in settled:
+				if cached is not None:
+					self.cache.put(url, *cached)
+		PAGE_RATE.set((self.pages + self.skipped + self.failed) / max(time.monotonic() - self.started, 1e-9))
+
+	def recrawl(self, *seeds):
+		"""crawl() for urls this crawler may have finished already, errors
+		being retried: on a visited set and an in-memory frontier of their own,
+		since a durable frontier keeps a finished url finished. Returns the
+		canonical urls fetched, the ones cut by the budget are not."""
+		frontier, visited, self.fetched = self.frontier, self.visited, set()
+		self.frontier = PriorityFrontier() if isinstance(frontier, PriorityFrontier) else MemoryFrontier()
+		self.visited = urlnorm.VisitedSet()
+		try:
+			self.crawl(*seeds)
+			return self.fetched
+		finally:
+			self.frontier, self.visited, self.fetched = frontier, visited, None
+
+	def crawl(self, *seeds):
+		self.started = time.monotonic()
+		seeds = [urlnorm.canonical(seed) for seed in seeds]
+		for seed in seeds:
+			self.budget.add_seed(seed, time.monotonic())
+		self._enqueue(seeds, 0)
+		window = deque()
+		running = {}
+		finished = 0
+		with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+			while True:
+				#leases on the window and the delayed retries outlive any wait below
+				renew = self.frontier.renew()
+				now = time.monotonic()
+				while self.delayed and self.delayed[0][0] <= now:
+					window.appendleft(heapq.heappop(self.delayed)[1:])
+				if len(window) < self.max_workers:
+					window.extend(self._admit(self.frontier.take(self.max_workers * 4 - len(window))))
+				if not window and not running and not self.delayed:
+					#a shared frontier may get more work from pages other workers hold
+					self._checkpoint()
+					if not self.frontier.waiting():
+						break
+					time.sleep(self.frontier.poll)
+					continue
+				wake = None
+				while len(running) < self.max_workers:
+					item, host, wake = self._next(window, now)
+					if item is None:
+						break
+					self.hosts.started(host, now)
+					running[pool.submit(self._visit, item[0])] = item + (host,)
+				wakes = [t for t in (wake, self.delayed[0][0] if self.delayed else None,
+					now + renew if renew is not None else None) if t is not None]
+				timeout = max(0.0, min(wakes) - now) if wakes else None
+				if not running:
+					time.sleep(timeout if timeout is not None else 0.01)
+					continue
+				QUEUE_DEPTH.set(len(window), queue="window")
+				QUEUE_DEPTH.set(len(running), queue="running")
+				QUEUE_DEPTH.set(len(self.delayed), queue="retry")
+				done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+				for future in done:
+					url, depth, attempt, host = running.pop(future)
+					self._finish(url, depth, attempt, host, future)
+					finished += 1
+					if finished % self.checkpoint_every == 0:
+						self._checkpoint()
+		for queue in ("window", "running", "retry"):
+			QUEUE_DEPTH.set(0, queue=queue)
+		self._checkpoint()
+		return self
@@ -0,0 +1,178 @@
+"""Database connections, created on first use and shared per process.
+
+Nothing connects at import time: mongo() builds one MongoClient per
+process the first time a collection is used, so importing model from the
+Flask app or a crawler costs nothing and every module in the process shares
+the same tuned pool. A client inherited across fork() is not reused, the
+child builds its own.
+
+MySQL connections for the ETL come from a small pool, mysql() checks one
+out for the duration of a with block.
+
+Settings come from the environment, defaulting to the local development
+credentials:
+
+	MONGO_URI (or MONGO_HOST, MONGO_USER, MONGO_PASSWORD, MONGO_AUTH_SOURCE)
+	MONGO_MAX_POOL, MONGO_MIN_POOL, MONGO_CONNECT_TIMEOUT_MS,
+	MONGO_SOCKET_TIMEOUT_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS,
+	MONGO_WAIT_QUEUE_TIMEOUT_MS
+	LINKS_DATABASE, the database holding links, urls, errorUrl and the rest
+	(default links; benchmarks point it at a scratch database)
+	MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE, MYSQL_POOL
+"""
+from contextlib import contextmanager
+import os
+import queue
+import threading
+
+
+def setting(name, default):
+	return os.environ.get(name, default)
+
+_lock = threading.Lock()
+_mongo = None
+_mongo_pid = None
+#----------------------------------------------------------------------------------
+
+def mongo():
+	global _mongo, _mongo_pid
+	if _mongo is not None and _mongo_pid == os.getpid():
+		return _mongo
+	import pymongo
+	with _lock:
+		if _mongo is None or _mongo_pid != os.getpid():
+			options = {
+				"maxPoolSize": int(setting("MONGO_MAX_POOL", 20)),
+				"minPoolSize": int(setting("MONGO_MIN_POOL", 0)),
+				"connectTimeoutMS": int(setting("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+				"socketTimeoutMS": int(setting("MONGO_SOCKET_TIMEOUT_MS", 30000)),
+				"serverSelectionTimeoutMS": int(setting("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+				"waitQueueTimeoutMS": int(setting("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000)),
+			}
+			uri = setting("MONGO_URI", None)
+			if uri:
+				_mongo = pymongo.MongoClient(uri, **options)
+			else:
+				_mongo = pymongo.MongoClient(setting("MONGO_HOST", "localhost"),
+					username=setting("MONGO_USER", "admin"),password=setting("MONGO_PASSWORD", "root"),
+					authSource=setting("MONGO_AUTH_SOURCE", "admin"),**options)
+			_mongo_pid = os.getpid()
+	return _mongo
+
+class LazyCollection(object):
+	"""Stands in for a pymongo collection and resolves it on first use."""
+
+	def __init__(self, database, name):
+		self.database = database
+		self.name = name
+		self._resolved = None
+		self._pid = None
+
+	def resolve(self):
+		if self._resolved is None or self._pid != os.getpid():
+			self._resolved = mongo()[self.database][self.name]
+			self._pid = os.getpid()
+		return self._resolved
+
+	def __getattr__(self, attribute):
+		return getattr(self.resolve(), attribute)
+
+	def __repr__(self):
+		return "LazyCollection(%r, %r)" % (self.database, self.name)
+
+def collection(database, name):
+	return LazyCollection(database, name)
+
+class Lazy(object):
+	"""Stands in for what factory() returns, made on first use (and again
+	in a forked child), for module-level names older scripts use as objects."""
+
+	def __init__(self, factory):
+		self.factory = factory
+		self._resolved = None
+		self._pid = None
+
+	def resolve(self):
+		if self._resolved is None or self._pid != os.getpid():
+			self._resolved = self.factory()
+			self._pid = os.getpid()
+		return self._resolved
+
+	def __getattr__(self, attribute):
+		return getattr(self.resolve(), attribute)
+
+	def __getitem__(self, key):
+		return self.resolve()[key]
+
+	def __iter__(self):
+		return iter(self.resolve())
+
+def links(name):
+	return collection(setting("LINKS_DATABASE", "links"), name)
+
+#----------------------------------------------------------------------------------
+
+class MySQLPool(object):
+	"""At most size connections, reused across checkouts and pinged (and
+	reconnected if needed) before being handed out."""
+
+	def __init__(self, size, **connect):
+		self.size = size
+		self.connect = connect
+		self.idle = queue.LifoQueue()
+		self.created = 0
+		self.lock = threading.Lock()
+
+	def _get(self):
+		try:
+			return self.idle.get_nowait()
+		except queue.Empty:
+			pass
+		with self.lock:
+			if self.created < self.size:
+				self.created += 1
+				import pymysql
+				try:
+					return pymysql.connect(**self.connect)
+				except Exception:
+					self.created -= 1
+					raise
+		return self.idle.get()
+
+	@contextmanager
+	def connection(self):
+		conn = self._get()
+		try:
+			conn.ping(reconnect=True)
+		except Exception:
+			with self.lock:
+				self.created -= 1
+			raise
+		try:
+			yield conn
+		except Exception:
+			conn.rollback()
+			raise
+		finally:
+			self.idle.put(conn)
+
+_mysql = None
+_mysql_pid = None
+
+def mysql_settings():
+	return {"host":setting("MYSQL_HOST", "localhost"),"user":setting("MYSQL_USER", "admin"),
+		"password":setting("MYSQL_PASSWORD", "root"),"database":setting("MYSQL_DATABASE", "books")}
+
+def mysql():
+	"""with db.mysql() as conn: ... a pooled pymysql connection."""
+	global _mysql, _mysql_pid
+	with _lock:
+		if _mysql is None or _mysql_pid != os.getpid():
+			_mysql = MySQLPool(int(setting("MYSQL_POOL", 4)),**mysql_settings())
+			_mysql_pid = os.getpid()
+	return _mysql.connection()
+
+def mysql_connect():
+	"""A pymysql connection of its own, outside the pool."""
+	import pymysql
+	return pymysql.connect(**mysql_settings())
@@ -0,0 +1,214 @@
+"""Stream links.links to and from NDJSON or CSV files, gzipped by default.
+
+	python dump.py export links.ndjson.gz --shards 4
+	python dump.py import links.*.ndjson.gz --workers 4
+
+Export reads the collection in _id order through a batched cursor and
+writes one line a link (_id, name, link, type), so memory stays flat
+whatever the corpus size. With --shards the _id range is cut into that
+many pieces of about equal size, each exported by its own process to its
+own file (links.00.ndjson.gz, links.01.ndjson.gz, ...).
+
+Import reads files line by line and writes them as unordered bulk
+upserts keyed on link, like writer.LinkWriter, keeping the exported _id
+for links that are new, so page cursors and snapshots stay valid across
+environments. Tokens are recomputed. Files are imported in parallel with
+--workers.
+
+The format follows the file name (.csv or .ndjson, .gz for gzip) unless
+--format says otherwise. Both commands report rows a second and MB a
+second, of the file as stored and of the uncompressed text.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import gzip
+import io
+import json
+import os
+import time
+from bson.objectid import ObjectId
+import pymongo
+import cache
+import db
+import search
+import writer
+
+
+FIELDS = ("_id", "name", "link", "type")
+#----------------------------------------------------------------------------------
+
+def file_format(path, fmt=None):
+	if fmt:
+		return fmt
+	name = path[:-3] if path.endswith(".gz") else path
+	return "csv" if name.endswith(".csv") else "ndjson"
+
+class Counted(io.RawIOBase):
+	"""Counts the bytes of a binary file as they go by."""
+
+	def __init__(self, raw):
+		self.raw = raw
+		self.count = 0
+
+	def readable(self):
+		return self.raw.readable()
+
+	def writable(self):
+		return self.raw.writable()
+
+	def readinto(self, buffer):
+		read = self.raw.readinto(buffer)
+		self.count += read or 0
+		return read
+
+	def write(self, data):
+		written = self.raw.write(data)
+		self.count += written
+		return written
+
+	def close(self):
+		#ends the gzip stream below, the file itself is closed by its owner
+		if not self.closed and not isinstance(self.raw, io.FileIO):
+			self.raw.close()
+		io.RawIOBase.close(self)
+
+def open_text(path, mode):
+	"""(text file, counter of the bytes stored, counter of the text bytes)."""
+	raw = open(path, mode + "b")
+	stored = Counted(raw)
+	if path.endswith(".gz"):
+		binary = gzip.GzipFile(fileobj=stored, mode=mode + "b", compresslevel=6)
+	else:
+		binary = stored
+	plain = Counted(binary)
+	buffered = io.BufferedWriter(plain, 1 << 20) if mode == "w" else io.BufferedReader(plain, 1 << 20)
+	return io.TextIOWrapper(buffered, encoding="utf-8", newline=""), stored, plain, raw
+
+def report(action, stats, elapsed):
+	mb = 1048576.0
+	print("%s %d rows in %.1fs: %.0f rows/s, %.1f MB/s stored (%.1f MB), %.1f MB/s text (%.1f MB)" % (
+		action, stats["rows"], elapsed, stats["rows"] / elapsed if elapsed else 0,
+		stats["stored"] / mb / elapsed if elapsed else 0, stats["stored"] / mb,
+		stats["text"] / mb / elapsed if elapsed else 0, stats["text"] / mb))
+
+#----------------------------------------------------------------------------------
+
+def boundaries(collection, shards):
+	"""_id values cutting the collection into shards pieces of about equal size."""
+	count = collection.estimated_document_count()
+	cuts = []
+	for shard in range(1, shards):
+		doc = next(iter(collection.find({}, {"_id":1}).sort("_id", pymongo.ASCENDING).skip(count * shard // shards).limit(1)), None)
+		if doc is not None and (not cuts or doc["_id"] > cuts[-1]):
+			cuts.append(doc["_id"])
+	return [None] + cuts + [None]
+
+def export_range(path, lower=None, upper=None, fmt=None, batch_size=5000):
+	"""Write the links with lower <= _id < upper to path."""
+	fmt = file_format(path, fmt)
+	bounds = {}
+	if lower is not None:
+		bounds["$gte"] = ObjectId(lower)
+	if upper is not None:
+		bounds["$lt"] = ObjectId(upper)
+	cursor = db.links("links").find({"_id":bounds} if bounds else {}, {"name":1,"link":1,"type":1},
+		batch_size=batch_size).sort("_id", pymongo.ASCENDING)
+	rows = 0
+	out, stored, plain, raw = open_text(path, "w")
+	with raw, out:
+		if fmt == "csv":
+			lines = csv.writer(out)
+			lines.writerow(FIELDS)
+			for doc in cursor:
+				lines.writerow((str(doc["_id"]), doc.get("name") or "", doc.get("link") or "", doc.get("type") or ""))
+				rows += 1
+		else:
+			for doc in cursor:
+				out.write(json.dumps({"_id":str(doc["_id"]),"name":doc.get("name"),"link":doc.get("link"),"type":doc.get("type")},
+					ensure_ascii=False, separators=(",", ":")) + "\n")
+				rows += 1
+	return {"rows":rows, "stored":stored.count, "text":plain.count}
+
+def shard_path(path, shard):
+	base, dot, rest = os.path.basename(path).partition(".")
+	return os.path.join(os.path.dirname(path), "%s.%02d%s%s" % (base, shard, dot, rest))
+
+def export(path, shards=1, fmt=None, batch_size=5000):
+	if shards <= 1:
+		return export_range(path, fmt=fmt, batch_size=batch_size)
+	cuts = [cut and str(cut) for cut in boundaries(db.links("links"), shards)]
+	total = {"rows":0, "stored":0, "text":0}
+	with ProcessPoolExecutor(max_workers=len(cuts) - 1) as pool:
+		futures = [pool.submit(export_range, shard_path(path, shard), cuts[shard], cuts[shard + 1], fmt, batch_size)
+			for shard in range(len(cuts) - 1)]
+		for future in futures:
+			for key, value in future.result().items():
+				total[key] += value
+	return total
+
+#----------------------------------------------------------------------------------
+
+def read_rows(source, fmt):
+	if fmt == "csv":
+		return csv.DictReader(source)
+	return (json.loads(line) for line in source if line.strip())
+
+def import_file(path, fmt=None, batch_size=5000):
+	links = db.links("links")
+	requests = []
+	rows = 0
+	source, stored, plain, raw = open_text(path, "r")
+	with raw, source:
+		for row in read_rows(source, file_format(path, fmt)):
+			if not row.get("link"):
+				continue
+			doc = {"name":row.get("name") or "","link":row["link"],"type":row.get("type") or None}
+			doc["tokens"] = search.link_tokens(doc)
+			update = {"$set":doc}
+			if row.get("_id"):
+				update["$setOnInsert"] = {"_id":ObjectId(row["_id"])}
+			requests.append(pymongo.UpdateOne({"link":doc["link"]}, update, upsert=True))
+			rows += 1
+			if len(requests) == batch_size:
+				links.bulk_write(requests, ordered=False)
+				requests = []
+		if requests:
+			links.bulk_write(requests, ordered=False)
+	return {"rows":rows, "stored":stored.count, "text":plain.count}
+
+def load(paths, workers=1, fmt=None, batch_size=5000):
+	links = db.links("links")
+	writer.ensure_unique(links, "link")
+	search.ensure_index(links)
+	total = {"rows":0, "stored":0, "text":0}
+	if workers <= 1 or len(paths) == 1:
+		results = [import_file(path, fmt, batch_size) for path in paths]
+	else:
+		with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+			results = list(pool.map(import_file, paths, [fmt] * len(paths), [batch_size] * len(paths)))
+	for result in results:
+		for key, value in result.items():
+			total[key] += value
+	#cached searches in the web workers are stale now
+	cache.bump_generation(db.links("meta"))
+	return total
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="stream links.links to and from NDJSON or CSV files")
+	commands = parser.add_subparsers(dest="command", required=True)
+	exporter = commands.add_parser("export")
+	exporter.add_argument("path", help="output file, e.g. links.ndjson.gz or links.csv.gz")
+	exporter.add_argument("--shards", type=int, default=1, help="split the _id range over this many files and processes")
+	importer = commands.add_parser("import")
+	importer.add_argument("paths", nargs="+")
+	importer.add_argument("--workers", type=int, default=1, help="files imported in parallel")
+	for command in (exporter, importer):
+		command.add_argument("--format", choices=("ndjson", "csv"))
+		command.add_argument("--batch-size", type=int, default=5000)
+	args = parser.parse_args()
+	start = time.perf_counter()
+	if args.command == "export":
+		report("exported", export(args.path, args.shards, args.format, args.batch_size), time.perf_counter() - start)
+	else:
+		report("imported", load(args.paths, args.workers, args.format, args.batch_size), time.perf_counter() - start)
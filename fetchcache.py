@@ -0,0 +1,25 @@
+import hashlib
+import pymongo
+
+
+def digest(page_html):
+	return hashlib.sha1(page_html).hexdigest()
+
+class FetchCache(object):
+	"""Per-URL record of the last successful fetch of a directory page:
+	its ETag and Last-Modified validators, a sha1 of the body and the
+	subdirectories it linked to.
+
+	Documents look like
+	{"url": ..., "etag": ..., "lastModified": ..., "hash": ..., "subdirs": [...]}
+	"""
+
+	def __init__(self, collection):
+		self.collection = collection
+		self.collection.create_index([("url", pymongo.ASCENDING)], unique=True)
+
+	def get(self, url):
+		return self.collection.find_one({"url":url})
+
+	def put(self, url, etag, lastModified, hash, subdirs):
+		self.collection.update_one({"url":url},{"$set":{"etag":etag,"lastModified":lastModified,"hash":hash,"subdirs":subdirs}},upsert=True)
@@ -0,0 +1,221 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError, SSLError
+import classifier
+
+
+user_agent = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/35.0.1916.47 Safari/537.36'
+#----------------------------------------------------------------------------------
+
+class FetchAborted(Exception):
+	"""The body was not read, or not to the end. Not retried: the same
+	url gives the same answer next time."""
+
+class NotListing(FetchAborted):
+	pass
+
+class TooLarge(FetchAborted):
+	pass
+
+def listing_type(content_type):
+	#directory indexes are HTML, some servers send them as text/plain or no type at all
+	if not content_type:
+		return True
+	content_type = content_type.split(";", 1)[0].strip().lower()
+	return content_type.startswith("text/") or "html" in content_type or content_type.endswith("xml")
+
+
+class CountingAdapter(HTTPAdapter):
+	"""HTTPAdapter whose connections report every TCP/TLS connect back to
+	the owning Session, everything else is stock keep-alive pooling.
+
+	Counted at connect(), not when the pool makes a connection object:
+	urllib3 reconnects the same object after the server closed it
+	(Connection: close, idle timeout, a body left unread)."""
+
+	def __init__(self, owner, **kwargs):
+		self.owner = owner
+		super(CountingAdapter, self).__init__(**kwargs)
+
+	def init_poolmanager(self, *args, **kwargs):
+		super(CountingAdapter, self).init_poolmanager(*args, **kwargs)
+		owner = self.owner
+
+		class CountingHTTPConnection(HTTPConnection):
+			def connect(self):
+				owner._count("connections")
+				return super(CountingHTTPConnection, self).connect()
+
+		class CountingHTTPSConnection(HTTPSConnection):
+			def connect(self):
+				owner._count("connections")
+				return super(CountingHTTPSConnection, self).connect()
+
+		class CountingHTTPPool(HTTPConnectionPool):
+			ConnectionCls = CountingHTTPConnection
+
+		class CountingHTTPSPool(HTTPSConnectionPool):
+			ConnectionCls = CountingHTTPSConnection
+
+		self.poolmanager.pool_classes_by_scheme = {"http": CountingHTTPPool, "https": CountingHTTPSPool}
+
+class Session(object):
+	"""Shared HTTP session for crawler fetches.
+
+	Connections are kept alive and pooled per host (pool_hosts hosts, up to
+	pool_maxsize connections each), responses may be gzip/deflate encoded.
+
+	Bodies are streamed in chunk_size pieces and held to max_bytes decoded,
+	so a fetch never holds more than that: a bigger body, or one whose
+	Content-Type is not a listing's, is abandoned with FetchAborted. Connect
+	and read timeouts apply to each socket operation, total_timeout to the
+	whole body, so a server trickling bytes cannot keep a worker. A url whose
+	extension classifies it as a file is probed with HEAD first and never
+	downloaded when it is one.
+
+	Counters: requests made, connections opened, bytes on the wire, decoded
+	body bytes, HEAD probes and aborted fetches; reused connections are
+	requests - connections.
+	"""
+
+	def __init__(self, pool_hosts=64, pool_maxsize=16, user_agent=user_agent, connect_timeout=5.0, read_timeout=20.0,
+			total_timeout=60.0, max_bytes=16 << 20, chunk_size=64 << 10, probe_files=True):
+		self.session = requests.Session()
+		self.session.headers.update({'User-Agent': user_agent, 'Accept-Encoding': 'gzip, deflate'})
+		adapter = CountingAdapter(self, pool_connections=pool_hosts, pool_maxsize=pool_maxsize)
+		self.session.mount("http://", adapter)
+		self.session.mount("https://", adapter)
+		self.lock = threading.Lock()
+		self.counters = {"requests":0,"connections":0,"bytes_wire":0,"bytes_body":0,"probes":0,"aborted":0}
+		self.timeout = (connect_timeout, read_timeout)
+		self.total_timeout = total_timeout
+		self.max_bytes = max_bytes
+		self.chunk_size = chunk_size
+		self.probe_files = probe_files
+
+	def _count(self, name, amount=1):
+		with self.lock:
+			self.counters[name] += amount
+
+	def _abort(self, exc):
+		self._count("aborted")
+		raise exc
+
+	def _check(self, url, response):
+		if not listing_type(response.headers.get("Content-Type")):
+			self._abort(NotListing("%s is %s" % (url, response.headers["Content-Type"])))
+		length = response.headers.get("Content-Length")
+		if length and length.isdigit() and int(length) > self.max_bytes:
+			self._abort(TooLarge("%s is %s bytes" % (url, length)))
+
+	def _probe(self, url):
+		#HEAD for a url named like a file; servers without HEAD get the GET
+		response = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+		self._count("probes")
+		if response.status_code in (405, 501):
+			return
+		response.raise_for_status()
+		self._check(url, response)
+
+	def _chunks(self, response):
+		#read1 hands over what has arrived instead of waiting for a full chunk,
+		#so the deadline holds against a server sending a byte at a time;
+		#errors are mapped the way iter_content maps them
+		read1 = getattr(response.raw, "read1", None)
+		if read1 is None:
+			#urllib3 1.x
+			for chunk in response.iter_content(self.chunk_size):
+				yield chunk
+			return
+		while True:
+			try:
+				chunk = read1(self.chunk_size, decode_content=True)
+			except ProtocolError as e:
+				raise requests.exceptions.ChunkedEncodingError(e)
+			except DecodeError as e:
+				raise requests.exceptions.ContentDecodingError(e)
+			except ReadTimeoutError as e:
+				raise requests.exceptions.ConnectionError(e)
+			except SSLError as e:
+				raise requests.exceptions.SSLError(e)
+			if not chunk:
+				return
+			yield chunk
+
+	def _read(self, url, response):
+		deadline = time.monotonic() + self.total_timeout
+		content = bytearray()
+		for chunk in self._chunks(response):
+			content += chunk
+			if len(content) > self.max_bytes:
+				self._abort(TooLarge("%s is over %d bytes" % (url, self.max_bytes)))
+			if time.monotonic() > deadline:
+				raise requests.exceptions.ReadTimeout("%s took over %.0fs" % (url, self.total_timeout))
+		return bytes(content)
+
+	def _request(self, url, headers=None):
+		if self.probe_files and classifier.classify(url.rstrip("/")) is not None:
+			self._probe(url)
+		response = self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+		content = b""
+		try:
+			#an error page or a file is not worth reading
+			response.raise_for_status()
+			if response.status_code != 304:
+				self._check(url, response)
+				content = self._read(url, response)
+			return response, content
+		finally:
+			with self.lock:
+				self.counters["requests"] += 1
+				self.counters["bytes_wire"] += response.raw.tell()
+				self.counters["bytes_body"] += len(content)
+			response.close()
+
+	def get(self, url):
+		return self._request(url)[1]
+
+	def revalidate(self, url, etag=None, last_modified=None):
+		"""Conditional GET. Returns (content, etag, last_modified) where
+		content is None when the server answered 304 Not Modified."""
+		headers = {}
+		if etag:
+			headers['If-None-Match'] = etag
+		if last_modified:
+			headers['If-Modified-Since'] = last_modified
+		response, content = self._request(url, headers)
+		if response.status_code == 304:
+			return None, etag, last_modified
+		return content, response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+	def stats(self):
+		with self.lock:
+			stats = dict(self.counters)
+		stats["reused"] = stats["requests"] - stats["connections"]
+		return stats
+
+	def close(self):
+		self.session.close()
+
+#----------------------------------------------------------------------------------
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def shared():
+	#one pooled session per process
+	global _shared
+	with _shared_lock:
+		if _shared is None:
+			_shared = Session()
+		return _shared
+
+def fetch(url):
+	return shared().get(url)
+
+def revalidate(url, etag=None, last_modified=None):
+	return shared().revalidate(url, etag, last_modified)
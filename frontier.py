@@ -0,0 +1,237 @@
+"""Crawl frontiers: the directories still to fetch, with their depth.
+
+MemoryFrontier keeps them in a deque for one-off crawls, PriorityFrontier
+in a heap ordered by the score the crawler gives each batch it adds (the
+number of classified links on the parent page).
+
+SqliteFrontier keeps every URL it has seen in a SQLite file as pending,
+inflight, done, failed or cut (left out by the crawl budget), so a crawl
+that dies can be resumed without refetching the pages it already finished. Its changes are batched into one transaction per
+commit(); the crawler commits after the writer has flushed the results of
+the pages being marked done. MongoFrontier is the same queue in a Mongo
+collection, leased out to crawlers running on several nodes. Both order
+by score instead of arrival with priority=True.
+"""
+from collections import deque
+import heapq
+import itertools
+import sqlite3
+import time
+
+
+class MemoryFrontier(object):
+
+	def __init__(self):
+		self.queue = deque()
+
+	def add(self, items, score=0):
+		self.queue.extend(items)
+
+	def take(self, count):
+		taken = []
+		while self.queue and len(taken) < count:
+			taken.append(self.queue.popleft())
+		return taken
+
+	def done(self, url):
+		pass
+
+	def failed(self, url):
+		pass
+
+	def cut(self, url):
+		pass
+
+	def commit(self):
+		pass
+
+	def renew(self):
+		return None
+
+	def waiting(self):
+		return 0
+
+	def close(self):
+		pass
+
+class PriorityFrontier(MemoryFrontier):
+	"""Highest score first, shallower and then older urls first among equals."""
+
+	def __init__(self):
+		self.queue = []
+		self.order = itertools.count()
+
+	def add(self, items, score=0):
+		for url, depth in items:
+			heapq.heappush(self.queue, (-score, depth, next(self.order), url))
+
+	def take(self, count):
+		taken = []
+		while self.queue and len(taken) < count:
+			score, depth, order, url = heapq.heappop(self.queue)
+			taken.append((url, depth))
+		return taken
+
+#----------------------------------------------------------------------------------
+
+class SqliteFrontier(object):
+
+	def __init__(self, path, priority=False):
+		self.path = path
+		self.priority = priority
+		self.db = sqlite3.connect(path)
+		self.db.execute("PRAGMA journal_mode=WAL")
+		self.db.execute("PRAGMA synchronous=NORMAL")
+		self.db.execute("CREATE TABLE IF NOT EXISTS frontier (url TEXT PRIMARY KEY, depth INTEGER NOT NULL, state TEXT NOT NULL, updated REAL NOT NULL, score INTEGER NOT NULL DEFAULT 0)")
+		if "score" not in [row[1] for row in self.db.execute("PRAGMA table_info(frontier)")]:
+			#frontier files written before scores existed
+			self.db.execute("ALTER TABLE frontier ADD COLUMN score INTEGER NOT NULL DEFAULT 0")
+		self.db.execute("CREATE INDEX IF NOT EXISTS frontier_state ON frontier (state)")
+		self.db.execute("CREATE INDEX IF NOT EXISTS frontier_score ON frontier (state, score DESC, depth)")
+		self.db.commit()
+
+	def add(self, items, score=0):
+		#a url already known keeps its state, done pages are not queued again
+		now = time.time()
+		self.db.executemany("INSERT OR IGNORE INTO frontier (url, depth, state, updated, score) VALUES (?, ?, 'pending', ?, ?)",
+			[(url, depth, now, score) for url, depth in items])
+
+	def take(self, count):
+		order = "score DESC, depth, rowid" if self.priority else "rowid"
+		rows = self.db.execute("SELECT url, depth FROM frontier WHERE state = 'pending' ORDER BY %s LIMIT ?" % order, (count,)).fetchall()
+		self._mark([url for url, depth in rows], "inflight")
+		return rows
+
+	def _mark(self, urls, state):
+		now = time.time()
+		self.db.executemany("UPDATE frontier SET state = ?, updated = ? WHERE url = ?", [(state, now, url) for url in urls])
+
+	def done(self, url):
+		self._mark([url], "done")
+
+	def failed(self, url):
+		self._mark([url], "failed")
+
+	def cut(self, url):
+		self._mark([url], "cut")
+
+	def commit(self):
+		self.db.commit()
+
+	def resume(self, retry_failed=False):
+		"""Requeue what was in flight or cut by the budget when the last run
+		stopped (and the failed urls too with retry_failed). Returns how many
+		were requeued."""
+		states = ("inflight", "cut", "failed") if retry_failed else ("inflight", "cut")
+		requeued = self.db.execute("UPDATE frontier SET state = 'pending' WHERE state IN (%s)" % ",".join("?" * len(states)), states).rowcount
+		self.db.commit()
+		return requeued
+
+	def renew(self):
+		return None
+
+	def waiting(self):
+		return 0
+
+	def counts(self):
+		return dict(self.db.execute("SELECT state, COUNT(*) FROM frontier GROUP BY state").fetchall())
+
+	def close(self):
+		self.db.commit()
+		self.db.close()
+
+#----------------------------------------------------------------------------------
+
+class MongoFrontier(object):
+	"""A frontier shared by crawlers on several nodes.
+
+	One document per url, _id being the url, so adding a directory any
+	worker already found is a no-op. take() leases pending urls one
+	findOneAndUpdate at a time, shallowest first; a lease that is not
+	finished within lease seconds (the worker died or hung) is handed to the
+	next worker asking. done and failed marks are buffered until commit(),
+	which runs after the writer flushed. Budgets are per worker: a url one
+	worker's budget cut goes back to the others, never to that worker again. This worker's remaining leases are
+	extended by commit() and by renew(), which the crawler calls between
+	pages so waiting out a backoff or a slow host does not lose them.
+	Finished urls stay in the collection so no worker crawls them twice;
+	drop it to crawl the same seeds afresh.
+	"""
+
+	def __init__(self, collection, worker, lease=120.0, poll=1.0, priority=False):
+		self.collection = collection
+		self.worker = worker
+		self.lease = lease
+		self.poll = poll
+		self.priority = priority
+		self.finished = {}
+		self.reclaimed = 0
+		self.renewed = time.monotonic()
+		collection.create_index([("state", 1), ("depth", 1)])
+		collection.create_index([("state", 1), ("score", -1), ("depth", 1)])
+		collection.create_index([("state", 1), ("expires", 1)])
+
+	def add(self, items, score=0):
+		from pymongo import UpdateOne
+		requests = [UpdateOne({"_id":url},{"$setOnInsert":{"depth":depth,"score":score,"state":"pending","expires":0.0}},upsert=True) for url, depth in items]
+		if requests:
+			self.collection.bulk_write(requests, ordered=False)
+
+	def take(self, count):
+		from pymongo import ASCENDING, DESCENDING
+		order = [("score", DESCENDING), ("depth", ASCENDING)] if self.priority else [("depth", ASCENDING)]
+		taken = []
+		while len(taken) < count:
+			now = time.time()
+			doc = self.collection.find_one_and_update(
+				{"$or":[{"state":"pending"},{"state":"leased","expires":{"$lt":now}},{"state":"cut","cutBy":{"$ne":self.worker}}]},
+				{"$set":{"state":"leased","worker":self.worker,"expires":now + self.lease}},
+				sort=order)
+			if doc is None:
+				break
+			self.reclaimed += doc["state"] == "leased"
+			taken.append((doc["_id"], doc["depth"]))
+		return taken
+
+	def done(self, url):
+		self.finished[url] = "done"
+
+	def failed(self, url):
+		self.finished[url] = "failed"
+
+	def cut(self, url):
+		self.finished[url] = "cut"
+
+	def commit(self):
+		from pymongo import UpdateOne
+		finished, self.finished = self.finished, {}
+		#only while we still hold the lease, a reclaimed url belongs to its new worker
+		requests = [UpdateOne({"_id":url,"worker":self.worker},
+			{"$set":{"state":state},"$addToSet":{"cutBy":self.worker}} if state == "cut" else {"$set":{"state":state}})
+			for url, state in finished.items()]
+		if requests:
+			self.collection.bulk_write(requests, ordered=False)
+		self._extend()
+
+	def _extend(self):
+		self.collection.update_many({"state":"leased","worker":self.worker},{"$set":{"expires":time.time() + self.lease}})
+		self.renewed = time.monotonic()
+
+	def renew(self):
+		"""Extend this worker's leases once a third of the lease passed since
+		they last were. Seconds until the next renewal is due."""
+		every = self.lease / 3
+		if time.monotonic() - self.renewed >= every:
+			self._extend()
+		return max(0.0, self.renewed + every - time.monotonic())
+
+	def waiting(self):
+		"""How many urls other workers are still crawling; their pages may
+		add more work, so a worker with nothing to do only stops at 0."""
+		return self.collection.count_documents({"state":"leased","worker":{"$ne":self.worker},"expires":{"$gte":time.time()}})
+
+	def counts(self):
+		return {group["_id"]: group["count"] for group in self.collection.aggregate([{"$group":{"_id":"$state","count":{"$sum":1}}}])}
+
+	def close(self):
+		self.commit()
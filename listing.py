@@ -0,0 +1,73 @@
+from bs4 import BeautifulSoup as soup
+
+try:
+	from lxml import etree
+except ImportError:
+	etree = None
+
+
+chunk_size = 64 * 1024
+#----------------------------------------------------------------------------------
+
+def decode(page_html):
+	if isinstance(page_html, str):
+		return page_html
+	try:
+		return page_html.decode("utf-8")
+	except UnicodeDecodeError:
+		return page_html.decode("windows-1252", "replace")
+
+def soup_links(page_html):
+	#reference implementation, builds the whole tree
+	page_soup = soup(page_html, "html.parser")
+	return [(link["href"], link.text) for link in page_soup.findAll("a",href=True)]
+
+def lxml_links(page_html):
+	"""Stream the page through lxml's pull parser and keep only anchors.
+
+	Every element is dropped as soon as it is closed unless it sits inside
+	an open <a>, so memory stays at one table row however long the listing.
+	"""
+	parser = etree.HTMLPullParser(events=("start","end"))
+	text = decode(page_html)
+	links = []
+	state = {"anchors":0}
+	for start in range(0, len(text), chunk_size):
+		parser.feed(text[start:start + chunk_size])
+		_collect(parser.read_events(), links, state)
+	parser.feed("")
+	parser.close()
+	_collect(parser.read_events(), links, state)
+	return links
+
+def _collect(events, links, state):
+	for event, element in events:
+		if element.tag != "a":
+			if event == "end" and not state["anchors"]:
+				_drop(element)
+			continue
+		if event == "start":
+			state["anchors"] += 1
+			continue
+		state["anchors"] -= 1
+		href = element.get("href")
+		if href is not None:
+			links.append((href, "".join(element.itertext())))
+		if not state["anchors"]:
+			_drop(element)
+
+def _drop(element):
+	element.clear(keep_tail=False)
+	parent = element.getparent()
+	if parent is not None:
+		while element.getprevious() is not None:
+			del parent[0]
+
+def extract_links(page_html):
+	"""(href, text) for every <a href> of a directory listing page."""
+	if etree is None:
+		return soup_links(page_html)
+	try:
+		return lxml_links(page_html)
+	except etree.Error:
+		return soup_links(page_html)
@@ -1,9 +1,26 @@
-from flask import Flask,request,render_template,jsonify
+from flask import Flask,request,render_template,jsonify,g,Response
 import json
+import time
+import metrics
 import model
 #--------------------------------------------------------------------------------------
 app = Flask(__name__)
+requestSeconds = metrics.histogram("http_request_seconds","Flask request latency, by endpoint",["endpoint"])
+requestsTotal = metrics.counter("http_requests_total","Flask requests, by endpoint and status",["endpoint","status"])
 #--------------------------------------------------------------------------------------
+@app.before_request
+def startTimer():
+	g.start = time.perf_counter()
+
+@app.after_request
+def recordRequest(response):
+	#url_rule keeps the label set small, unknown paths all count as 404
+	endpoint = request.url_rule.rule if request.url_rule else "404"
+	if "start" in g:
+		requestSeconds.observe(time.perf_counter()-g.start,endpoint=endpoint)
+	requestsTotal.inc(endpoint=endpoint,status=response.status_code)
+	return response
+
 @app.route('/')
 def index():
 	#print(request.method)
@@ -21,21 +38,27 @@ def index():
 #for index ajax purpose
 @app.route('/searchAJAX',methods=['GET'])
 def process():
-	search=request.args["search"]
-	linkType = request.args["type"]
-	#print(search,linkType)
-	splt = search.split(" ")
-	search = []
-	for word in splt:
-		if word != "":
-			search.append(word)
-	if search[0] == "" or search[0] == "%":
-		return json.dumps({'error':'True'})
-	links=model.getList(search[0],linkType)
-	if links:
-		return jsonify(links)
-	else:
-		return jsonify({'error':'True'})
+	#a search running past model.searchTimeout answers 504 instead of holding the worker
+	body,status = model.searchResponse(request.args["search"],request.args["type"],request.args.get("after"),model.searchTimeout)
+	return jsonify(body),status
+#--------------------------------------------------------------------------------------
+#search box completions, one request a keystroke
+@app.route('/complete',methods=['GET'])
+def completions():
+	return jsonify({'completions':model.getCompletions(request.args.get("q",""),request.args.get("k",10,type=int))})
+#--------------------------------------------------------------------------------------
+#query cache counters, for sizing it
+@app.route('/cacheStats',methods=['GET'])
+def cacheStats():
+	return jsonify(model.queryCache.stats())
+
+#--------------------------------------------------------------------------------------
+#Prometheus scrape target: request and getList latency, query cache, plus the
+#crawl and writer metrics when a crawl runs in this process
+@app.route('/metrics',methods=['GET'])
+def metricsPage():
+	return Response(metrics.render(),content_type=metrics.CONTENT_TYPE)
+
 #--------------------------------------------------------------------------------------
 
 
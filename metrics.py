@@ -0,0 +1,189 @@
+"""Counters, gauges and latency histograms in the Prometheus text format.
+
+Metrics are process wide: modules declare theirs at import time with
+counter(), gauge() and histogram(), and render() writes every registered
+metric in the exposition format Prometheus scrapes. The Flask app serves
+it on /metrics; a crawler or ETL process can serve its own with serve().
+
+Observations take one lock per metric, cheap enough for per-page and
+per-request use. Rates (pages a second, requests a second) are left to
+the scraper, rate(crawl_pages_total[1m]) and friends.
+"""
+from contextlib import contextmanager
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+#----------------------------------------------------------------------------------
+
+def _escape(value):
+	return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+	pairs = list(zip(names, values)) + list(extra)
+	if not pairs:
+		return ""
+	return "{" + ",".join('%s="%s"' % (name, _escape(value)) for name, value in pairs) + "}"
+
+def _number(value):
+	if value == float("inf"):
+		return "+Inf"
+	return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric(object):
+	kind = "untyped"
+
+	def __init__(self, name, help, labels=()):
+		self.name = name
+		self.help = help
+		self.labelnames = tuple(labels)
+		self.values = {}
+		self.lock = threading.Lock()
+
+	def _key(self, labels):
+		return tuple(labels[name] for name in self.labelnames)
+
+	def samples(self):
+		with self.lock:
+			return [(self.name, key, (), value) for key, value in self.values.items()]
+
+	def render(self):
+		lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s %s" % (self.name, self.kind)]
+		for name, key, extra, value in self.samples():
+			lines.append("%s%s %s" % (name, _labels(self.labelnames, key, extra), _number(value)))
+		return "\n".join(lines)
+
+class Counter(Metric):
+	kind = "counter"
+
+	def inc(self, amount=1, **labels):
+		key = self._key(labels)
+		with self.lock:
+			self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+	kind = "gauge"
+
+	def __init__(self, name, help, labels=()):
+		Metric.__init__(self, name, help, labels)
+		self.functions = {}
+
+	def set(self, value, **labels):
+		with self.lock:
+			self.values[self._key(labels)] = value
+
+	def set_function(self, function, **labels):
+		"""Read the value from function() at every render."""
+		with self.lock:
+			self.functions[self._key(labels)] = function
+
+	def samples(self):
+		samples = Metric.samples(self)
+		for key, function in list(self.functions.items()):
+			try:
+				samples.append((self.name, key, (), function()))
+			except Exception:
+				#a source that cannot be read is left out of this scrape
+				pass
+		return samples
+
+class Histogram(Metric):
+	kind = "histogram"
+
+	def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+		Metric.__init__(self, name, help, labels)
+		self.buckets = tuple(sorted(buckets))
+
+	def observe(self, value, **labels):
+		key = self._key(labels)
+		i = bisect_left(self.buckets, value)
+		with self.lock:
+			counts = self.values.get(key)
+			if counts is None:
+				#one count per bucket plus +Inf, then the sum
+				counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+			counts[i] += 1
+			counts[-1] += value
+
+	@contextmanager
+	def time(self, **labels):
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe(time.perf_counter() - start, **labels)
+
+	def samples(self):
+		samples = []
+		with self.lock:
+			values = [(key, list(counts)) for key, counts in self.values.items()]
+		for key, counts in values:
+			total = 0
+			for bound, count in zip(self.buckets + (float("inf"),), counts):
+				total += count
+				samples.append((self.name + "_bucket", key, (("le", _number(float(bound))),), total))
+			samples.append((self.name + "_sum", key, (), counts[-1]))
+			samples.append((self.name + "_count", key, (), total))
+		return samples
+
+#----------------------------------------------------------------------------------
+
+class Registry(object):
+
+	def __init__(self):
+		self.metrics = {}
+		self.lock = threading.Lock()
+
+	def register(self, cls, name, help, labels=(), **options):
+		#declaring a metric twice (a module imported again) returns the first one
+		with self.lock:
+			metric = self.metrics.get(name)
+			if metric is None:
+				metric = self.metrics[name] = cls(name, help, labels, **options)
+			return metric
+
+	def render(self):
+		with self.lock:
+			metrics = list(self.metrics.values())
+		return "\n".join(metric.render() for metric in metrics) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name, help, labels=()):
+	return REGISTRY.register(Counter, name, help, labels)
+
+def gauge(name, help, labels=()):
+	return REGISTRY.register(Gauge, name, help, labels)
+
+def histogram(name, help, labels=(), buckets=LATENCY_BUCKETS):
+	return REGISTRY.register(Histogram, name, help, labels, buckets=buckets)
+
+def render():
+	return REGISTRY.render()
+
+def serve(port, host="0.0.0.0"):
+	"""Serve /metrics on a daemon thread, for processes without the Flask app."""
+	class Handler(BaseHTTPRequestHandler):
+
+		def do_GET(self):
+			if self.path.split("?")[0] != "/metrics":
+				self.send_error(404)
+				return
+			body = render().encode("utf-8")
+			self.send_response(200)
+			self.send_header("Content-Type", CONTENT_TYPE)
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, format, *args):
+			pass
+
+	server = ThreadingHTTPServer((host, port), Handler)
+	server.daemon_threads = True
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
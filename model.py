@@ -1,199 +1,266 @@
-from bs4 import BeautifulSoup as soup
-import pymongo
-import requests
-import urllib.request
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+import os
+import socket
+import time
+from urllib.parse import urlsplit
+from bson.errors import InvalidId
+from pymongo.errors import ExecutionTimeout
+import budget
+import cache
+import classifier
+import complete
+import crawler
+import db
+import fetchcache
+import frontier
+import metrics
+import search
+import snapshot
+import urlnorm
+import writer
 
 
-#create connection
-dbmongo = pymongo.MongoClient(username="admin",password="root",authSource="admin")
+#collections connect on first use, see db.py
 #------------------
-LinksLinksCollection = dbmongo.links.links
-LinksUrlCollection = dbmongo.links.urls
-LinksErrorUrlCollection = dbmongo.links.errorUrl
+LinksLinksCollection = db.links("links")
+LinksUrlCollection = db.links("urls")
+LinksErrorUrlCollection = db.links("errorUrl")
+LinksFetchCacheCollection = db.links("fetchCache")
+LinksMetaCollection = db.links("meta")
+LinksQueueCollection = db.links("queue")
+LinksChangesCollection = db.links("changes")
 #------------------
-TestdbUrlsCollection = dbmongo.testdb.urls
-TestdbStudentsCollection = dbmongo.testdb.students
+TestdbUrlsCollection = db.collection("testdb","urls")
+TestdbStudentsCollection = db.collection("testdb","students")
+#----------------------------------------------------------------------------------
+queryCache = cache.QueryCache(maxsize=2048,ttl=300,generation=lambda: cache.read_generation(LinksMetaCollection),
+	changes=cache.ChangeFeed(LinksMetaCollection,LinksChangesCollection))
+searchFlight = cache.SingleFlight()
+#seconds a search may take before the request gets a 504
+searchTimeout = float(db.setting("SEARCH_TIMEOUT", 2.0))
+#with a snapshot file (snapshot.py) searches are answered from it, not from Mongo
+linksSnapshotPath = db.setting("LINKS_SNAPSHOT", None)
+linksSnapshot = snapshot.SnapshotFile(linksSnapshotPath) if linksSnapshotPath else None
+#search box completions, picks up new links every COMPLETE_REFRESH seconds
+linksCompletions = complete.Completions(LinksLinksCollection,float(db.setting("COMPLETE_REFRESH", 10.0)))
+#----------------------------------------------------------------------------------
+getListSeconds = metrics.histogram("getlist_seconds","getList latency, by whether the query cache answered",["cache"])
+cacheEntries = metrics.gauge("query_cache_entries","Results held in the query cache")
+cacheEntries.set_function(lambda: queryCache.stats()["size"])
+cacheHitRate = metrics.gauge("query_cache_hit_rate","Share of getList calls answered from the query cache")
+cacheHitRate.set_function(lambda: queryCache.stats()["hit_rate"])
+sharedSearches = metrics.gauge("search_coalesced","getList misses answered by a concurrent identical lookup, since start")
+sharedSearches.set_function(lambda: searchFlight.stats()["shared"])
 #----------------------------------------------------------------------------------
 
-def getList(query="default",linkType="all",skip=1):
-	search_query = {'$regex': "", '$options': 'i'}
-	search_query["$regex"] = query
-	
-	links = []
-	num = 0
-	
-	if linkType == "all":
-		for item in LinksLinksCollection.find({'link': search_query}).limit(10):
-			#print(item["name"])
-			if links.__len__()-1 != num:
-				links.append({})
-			links[num]['id'] = str(item["_id"])
-			links[num]['name'] = item["name"]
-			links[num]['link'] = item["link"]
-			links[num]['type'] = item["type"]
-			#links.append({}) extra append should be created
-			num += 1
-	#db.links.find({$and:[{"link":{$regex:"cold",$options:"i"}},{"link":{$regex:"skin",$options:"i"}}]})
-	if linkType == "video":
-		for item in LinksLinksCollection.find({"$and":[{"type":"video"},{'link': search_query}]}).limit(10):
-			#print(item["name"])
-			if links.__len__()-1 != num:
-				links.append({})
-			links[num]['id'] = str(item["_id"])
-			links[num]['name'] = item["name"]
-			links[num]['link'] = item["link"]
-			links[num]['type'] = item["type"]
-			#links.append({}) extra append should be created
-			num += 1
+def linksCommitted(docs):
+	#new links make cached results for their tokens stale, here and in every other process
+	tokens = [token for doc in docs for token in doc["tokens"]]
+	queryCache.invalidate(tokens)
+	cache.publish_changes(LinksMetaCollection,LinksChangesCollection,tokens)
 
-	if linkType == "audio":
-		for item in LinksLinksCollection.find({"$and":[{"type":"audio"},{'link': search_query}]}).limit(10):
-			#print(item["name"])
-			if links.__len__()-1 != num:
-				links.append({})
-			links[num]['id'] = str(item["_id"])
-			links[num]['name'] = item["name"]
-			links[num]['link'] = item["link"]
-			links[num]['type'] = item["type"]
-			#links.append({}) extra append should be created
-			num += 1
+def searchKey(query,linkType="all",after=None,limit=10):
+	#identical searches share this key in the query cache and in flight
+	return (tuple(search.tokenize(query)),linkType,after,limit)
 
-	if linkType == "image":
-		for item in LinksLinksCollection.find({"$and":[{"type":"image"},{'link': search_query}]}).limit(10):
-			#print(item["name"])
-			if links.__len__()-1 != num:
-				links.append({})
-			links[num]['id'] = str(item["_id"])
-			links[num]['name'] = item["name"]
-			links[num]['link'] = item["link"]
-			links[num]['type'] = item["type"]
-			#links.append({}) extra append should be created
-			num += 1
+def getList(query="default",linkType="all",after=None,limit=10,timeout=None):
+	#all space separated terms must match, type filter goes into the same query
+	#returns one page of links and the cursor for the next page (None when done)
+	#concurrent identical misses share one Mongo query; timeout (seconds) bounds
+	#both the wait for it and the query itself (TimeoutError / ExecutionTimeout)
+	if linkType != "all" and linkType not in classifier.TYPES:
+		return [], None
+	start = time.perf_counter()
+	key = searchKey(query,linkType,after,limit)
+	cached = queryCache.get(key)
+	if cached is not None:
+		getListSeconds.observe(time.perf_counter()-start,cache="hit")
+		return cached
+	def lookup():
+		#links written while the query runs may be missing from its result
+		version = queryCache.version()
+		current = linksSnapshot and linksSnapshot.get()
+		if current is not None:
+			result = current.find(query,None if linkType == "all" else linkType,after,limit)
+			queryCache.put(key, result, version)
+			return result
+		items, nextPage = search.find(LinksLinksCollection,query,None if linkType == "all" else linkType,
+			search.parse_cursor(after),limit,timeout and int(timeout*1000))
+		links = [{'id':str(item["_id"]),'name':item["name"],'link':item["link"],'type':item["type"]} for item in items]
+		result = (links, None if nextPage is None else str(nextPage))
+		queryCache.put(key, result, version)
+		return result
+	result = searchFlight.do(key,lookup,timeout)
+	getListSeconds.observe(time.perf_counter()-start,cache="miss")
+	return result
 
-	if linkType == "compressed":
-		for item in LinksLinksCollection.find({"$and":[{"type":"compressed"},{'link': search_query}]}).limit(10):
-			#print(item["name"])
-			if links.__len__()-1 != num:
-				links.append({})
-			links[num]['id'] = str(item["_id"])
-			links[num]['name'] = item["name"]
-			links[num]['link'] = item["link"]
-			links[num]['type'] = item["type"]
-			#links.append({}) extra append should be created
-			num += 1
+def getCompletions(query,k=10):
+	#completes the last word being typed, the words before it stay as they are
+	#k most frequent, at most 20
+	terms = search.tokenize(query)
+	k = max(0,min(k,20))
+	if not terms or not k or not query[-1:].isalnum():
+		return []
+	before = " ".join(terms[:-1])
+	return [{'text':(before+" "+word).strip(),'count':count} for word,count in linksCompletions.complete(terms[-1],k)]
 
-	if linkType == "executable":
-		for item in LinksLinksCollection.find({"$and":[{"type":"executable"},{'link': search_query}]}).limit(10):
-			#print(item["name"])
-			if links.__len__()-1 != num:
-				links.append({})
-			links[num]['id'] = str(item["_id"])
-			links[num]['name'] = item["name"]
-			links[num]['link'] = item["link"]
-			links[num]['type'] = item["type"]
-			#links.append({}) extra append should be created
-			num += 1
+def searchResponse(search,linkType,after=None,timeout=None):
+	#/searchAJAX body and status for the raw query string values, shared by
+	#the Flask app and the ASGI app
+	terms = [word for word in search.split(" ") if word != ""]
+	if not terms or terms[0] == "%":
+		return {'error':'True'}, 200
+	try:
+		links,after = getList(" ".join(terms),linkType,after or None,timeout=timeout)
+	except InvalidId:
+		return {'error':'True'}, 200
+	except (TimeoutError, ExecutionTimeout):
+		return {'error':'True','timeout':'True'}, 504
+	if links:
+		return {'links':links,'after':after}, 200
+	return {'error':'True'}, 200
 
-	if linkType == "disk":
-		for item in LinksLinksCollection.find({"$and":[{"type":"disk"},{'link': search_query}]}).limit(10):
-			#print(item["name"])
-			if links.__len__()-1 != num:
-				links.append({})
-			links[num]['id'] = str(item["_id"])
-			links[num]['name'] = item["name"]
-			links[num]['link'] = item["link"]
-			links[num]['type'] = item["type"]
-			#links.append({}) extra append should be created
-			num += 1
+def Crawl(url=None,max_workers=16,per_host=4,incremental=False,frontierPath=None,resume=False,rate=5.0,retryErrors=False,distributed=False,limits=None,priority=False):
+	#iterative frontier crawl, see crawler.Crawler
+	#incremental re-crawls only what changed since the last incremental run
+	#frontierPath keeps the frontier in a SQLite file, resume picks up a crawl that died
+	#rate caps the requests a second sent to each host (None for no cap)
+	#retryErrors crawls the urls in errorUrl again after url, the ones failing again stay
+	#distributed leases directories from links.queue, shared with the workers on other nodes
+	#limits is a budget.Budget for every seed, priority fetches the directories under the pages with most links first
+	pages = fetchcache.FetchCache(LinksFetchCacheCollection) if incremental else None
+	if distributed:
+		queue = frontier.MongoFrontier(LinksQueueCollection,"%s:%d" % (socket.gethostname(),os.getpid()),priority=priority)
+	elif frontierPath:
+		queue = frontier.SqliteFrontier(frontierPath,priority=priority)
+	else:
+		queue = frontier.PriorityFrontier() if priority else None
+	if resume:
+		print("requeued:",queue.resume())
+	try:
+		with writer.LinkWriter(LinksLinksCollection,LinksUrlCollection,LinksErrorUrlCollection) as links:
+			links.on_commit.append(linksCommitted)
+			result = crawler.Crawler(links,max_workers=max_workers,per_host=per_host,cache=pages,frontier=queue,rate=rate,budget=limits)
+			result.crawl(*([url] if url else []))
+			if retryErrors:
+				retryErrorUrls(result)
+			return result
+	finally:
+		if queue is not None:
+			queue.close()
 
-	if linkType == "text":
-		for item in LinksLinksCollection.find({"$and":[{"type":"text"},{'link': search_query}]}).limit(10):
-			#print(item["name"])
-			if links.__len__()-1 != num:
-				links.append({})
-			links[num]['id'] = str(item["_id"])
-			links[num]['name'] = item["name"]
-			links[num]['link'] = item["link"]
-			links[num]['type'] = item["type"]
-			#links.append({}) extra append should be created
-			num += 1
+def retryErrorUrls(result,batch_size=1000):
+	#errorUrl is read a batch at a time and a url only leaves it once fetched again:
+	#the ones failing again get a newer failedAt and stay, a crash loses nothing
+	#recrawl, since result may have just failed (and visited) the same urls
+	started = datetime.now(timezone.utc)
+	pending = {"$or":[{"failedAt":{"$lt":started}},{"failedAt":{"$exists":False}}]}
+	while True:
+		batch = [doc["ErrorUrl"] for doc in LinksErrorUrlCollection.find(pending,{"ErrorUrl":1,"_id":0}).limit(batch_size)]
+		if not batch:
+			return result
+		fetched = result.recrawl(*batch)
+		retried = [url for url in batch if urlnorm.canonical(url) in fetched]
+		LinksErrorUrlCollection.delete_many({"$and":[{"ErrorUrl":{"$in":retried}},pending]})
+		#out of budget: left for the next run, not read again in this one
+		LinksErrorUrlCollection.update_many({"$and":[{"ErrorUrl":{"$in":batch}},pending]},{"$set":{"failedAt":datetime.now(timezone.utc)}})
 
-	return links
+def readSeeds(path):
+	#one url a line, blank lines and # comments skipped, duplicates dropped
+	seeds = []
+	with open(path) as f:
+		for line in f:
+			url = line.split("#",1)[0].strip()
+			if url and url not in seeds:
+				seeds.append(url)
+	return seeds
 
-def Crawl(url):
-	
-	try:
-		user_agent = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/35.0.1916.47 Safari/537.36'
-		headers = {'User-Agent': user_agent}
-		request = urllib.request.Request(url,headers={'User-Agent': user_agent})
-		response = urllib.request.urlopen(request)
-		page_html = response.read()
-		response.close()
-		print("Parsing URL..."+ url)
-		page_soup = soup(page_html, "html.parser")
-		links = page_soup.findAll("a",href=True)
-	except:
-		LinksErrorUrlCollection.insert({"ErrorUrl":url})
-		print("ERROR:"+url)
+def crawlSeed(url,options):
+	#one seed in a pool process, with its own Crawler, hosts and budget;
+	#its links go to the same collections as every other seed's
+	start = time.monotonic()
+	summary = {"seed":url,"pages":0,"links":0,"errors":0,"seconds":0.0,"failure":None}
 	try:
-		dirLink = []
-		num = 0
-		for link in links:
-			completeLink = url+link["href"]
-			print(link["href"],url)
-			if link["href"].endswith("/") and not link["href"].endswith("../") and not link["href"].startswith("/"):
-				#call the crawl function again
-				Crawl(str(url+link["href"]))
-			else:
-				if dirLink.__len__()-1 != num:
-					dirLink.append({})
-				fullLink=str(url+link["href"])
+		result = Crawl(url,**options)
+		summary.update(pages=result.pages,links=result.found,errors=result.failed)
+	except Exception as e:
+		summary["failure"] = repr(e)
+	summary["seconds"] = time.monotonic()-start
+	return summary
 
-				if fullLink.lower().endswith(("mp4","mkv","3gp","avi","mov","mpg","mpeg","wmv","m4v")):
-					dirLink[num]["name"]=link.text
-					dirLink[num]["link"]=fullLink
-					dirLink[num]["type"]="video"
-					num += 1
-				elif fullLink.lower().endswith(("mp3","aif","mid","midi","mpa","ogg","wav","wma","wpl")):
-					dirLink[num]["name"]=link.text
-					dirLink[num]["link"]=fullLink
-					dirLink[num]["type"]="audio"
-					num += 1
-				elif fullLink.lower().endswith(("rar","zip","deb","pkg","tar.gz",".z","rpm",".7z","arj")):
-					dirLink[num]["name"]=link.text
-					dirLink[num]["link"]=fullLink
-					dirLink[num]["type"]="compressed"
-					num += 1
-				elif fullLink.lower().endswith(("bin","dmg","iso","toast","vcd")):
-					dirLink[num]["name"]=link.text
-					dirLink[num]["link"]=fullLink
-					dirLink[num]["type"]="disk"
-					num += 1
-				elif fullLink.lower().endswith(("exe","apk","bat","com","jar",".py",".wsf")):
-					dirLink[num]["name"]=link.text
-					dirLink[num]["link"]=fullLink
-					dirLink[num]["type"]="executable"
-					num += 1
-				elif fullLink.lower().endswith(("ai","bmp","gif","ico","jpeg","png","jpg","tif","svg")):
-					dirLink[num]["name"]=link.text
-					dirLink[num]["link"]=fullLink
-					dirLink[num]["type"]="image"
-					num += 1
-				elif fullLink.lower().endswith(("pdf","txt","doc","rtf","wpd","docx","odt","wps","wks")):
-					dirLink[num]["name"]=link.text
-					dirLink[num]["link"]=fullLink
-					dirLink[num]["type"]="text"
-					num += 1
-				else:
-					pass	
+def crawlHost(seeds,options):
+	#the seeds of one host one after the other, so the host never sees more
+	#than one crawl's per_host and rate
+	return [crawlSeed(url,options) for url in seeds]
 
-		if dirLink != [{}]:
-			LinksLinksCollection.insert_many(dirLink)
-			LinksUrlCollection.insert({"url":url})
-			#return dirLink
-	except:
-		LinksErrorUrlCollection.insert({"ErrorUrl":url})
-		print("ERROR in second try:"+url)
+def CrawlSeeds(seeds,processes=4,**options):
+	#crawls the seeds of each host in a pool of processes, so a slow host holds
+	#up one process and not the other hosts; options go to Crawl
+	#yields the summaries of a host's seeds once they are all done
+	hosts = {}
+	for url in seeds:
+		hosts.setdefault(urlsplit(url).netloc.lower(),[]).append(url)
+	with ProcessPoolExecutor(max_workers=processes) as pool:
+		#hosts with most seeds first, they take longest
+		futures = [pool.submit(crawlHost,group,options) for group in sorted(hosts.values(),key=len,reverse=True)]
+		for future in as_completed(futures):
+			for summary in future.result():
+				yield summary
 
 if __name__ == '__main__':
-	print(Crawl(input("Enter:")))
\ No newline at end of file
+	parser = argparse.ArgumentParser(description="crawl an open directory index into links.links")
+	parser.add_argument("url",nargs="?")
+	parser.add_argument("--seeds",help="file of seed urls, one a line, crawled in parallel by --processes")
+	parser.add_argument("--processes",type=int,default=4,help="hosts crawled at once with --seeds, a host's seeds go one after the other")
+	parser.add_argument("--incremental",action="store_true",help="skip pages unchanged since the last incremental crawl")
+	parser.add_argument("--frontier",help="SQLite file holding the crawl frontier")
+	parser.add_argument("--resume",action="store_true",help="continue the crawl recorded in --frontier")
+	parser.add_argument("--workers",type=int,default=16)
+	parser.add_argument("--per-host",type=int,default=4)
+	parser.add_argument("--rate",type=float,default=5.0,help="requests a second per host, 0 for no limit")
+	parser.add_argument("--retry-errors",action="store_true",help="crawl the urls in links.errorUrl again")
+	parser.add_argument("--distributed",action="store_true",help="share the frontier in links.queue with workers on other nodes")
+	parser.add_argument("--max-depth",type=int,help="directory levels below each seed")
+	parser.add_argument("--max-subdirs",type=int,help="subdirectories followed from any one page")
+	parser.add_argument("--max-pages",type=int,help="pages crawled per seed")
+	parser.add_argument("--max-links",type=int,help="links collected per seed")
+	parser.add_argument("--max-time",type=float,help="seconds spent on each seed, bounds a slow seed in --seeds")
+	parser.add_argument("--priority",action="store_true",help="crawl directories under the pages with most links first")
+	parser.add_argument("--metrics-port",type=int,help="serve Prometheus metrics on this port while crawling")
+	args = parser.parse_args()
+	if args.resume and not args.frontier:
+		parser.error("--resume needs --frontier")
+	if args.distributed and args.frontier:
+		parser.error("--distributed keeps the frontier in links.queue, not in --frontier")
+	if args.seeds and (args.url or args.frontier or args.retry_errors or args.distributed):
+		parser.error("--seeds crawls each seed on its own, without url, --frontier, --retry-errors or --distributed")
+	if args.seeds and args.metrics_port:
+		#the crawl metrics are recorded in the pool processes, not in this one
+		parser.error("--metrics-port serves one crawl process, --seeds runs many")
+	if args.metrics_port:
+		metrics.serve(args.metrics_port)
+	limits = budget.Budget(args.max_depth,args.max_subdirs,args.max_pages,args.max_links,args.max_time)
+	if args.seeds:
+		totals = {"pages":0,"links":0,"errors":0,"failed":0}
+		start = time.monotonic()
+		for summary in CrawlSeeds(readSeeds(args.seeds),args.processes,max_workers=args.workers,per_host=args.per_host,
+				incremental=args.incremental,rate=args.rate or None,limits=limits,priority=args.priority):
+			print("%-60s pages: %6d links: %8d errors: %5d %8.1fs %s" % (summary["seed"],summary["pages"],summary["links"],
+				summary["errors"],summary["seconds"],summary["failure"] or ""))
+			for name in ("pages","links","errors"):
+				totals[name] += summary[name]
+			totals["failed"] += summary["failure"] is not None
+		print("seeds done in %.1fs, pages: %d links: %d errors: %d failed seeds: %d" % (time.monotonic()-start,totals["pages"],
+			totals["links"],totals["errors"],totals["failed"]))
+	else:
+		url = args.url
+		#a distributed worker without a url joins the crawl already in the queue
+		if url is None and not args.resume and not args.retry_errors and not args.distributed:
+			url = input("Enter:")
+		result = Crawl(url,args.workers,args.per_host,args.incremental,args.frontier,args.resume,args.rate or None,args.retry_errors,args.distributed,
+			limits,args.priority)
+		print("pages:",result.pages,"links:",result.found,"errors:",result.failed,
+			"skipped:",result.skipped,"refetched:",result.refetched,
+			"retried:",result.hosts.retried,"throttled:",result.hosts.throttled,"over budget:",result.budget.cut)
@@ -1,8 +1,15 @@
-import pymongo
-import pymysql as mysqldb
-
-dbmongo = pymongo.MongoClient(username="admin",password="root",authSource="admin")
-collection = dbmongo.links.links
+import argparse
+import os
+import pymysql
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import cache
+import classifier
+import db
+import search
+import writer
+
+collection = db.links("links")
 
 #db.users.find({'name': {'$regex': 'sometext', '$options': 'i'}})
 
@@ -27,64 +34,87 @@ def query(text="default"):
 	for link in links:
 		print(link)
 
-def main():
-	dbmysql = mysqldb.connect("localhost","admin","root","books")
-	cursor = dbmysql.cursor()
-
-	f = open("num","r")
-	num = int(f.read())
-	f.close()
-
-
-	sql='DELETE n1 FROM book_links n1, book_links n2 WHERE n1.id > n2.id AND n1.book_link = n2.book_link;'
-	cursor.execute(sql)
-
-	sql = "select * from book_links where id > %d;" % num
-	print(sql)
-	cursor.execute(sql)
-	result = cursor.fetchall()
-
+def readWatermark(path="num"):
+	try:
+		with open(path,"r") as f:
+			return int(f.read())
+	except FileNotFoundError:
+		return 0
+
+def writeWatermark(num,path="num"):
+	#write-then-rename so a crash leaves either the old or the new value
+	tmp = path+".tmp"
+	with open(tmp,"w") as f:
+		f.write(str(num))
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(tmp,path)
+
+def transform(rows):
+	#(id, book_name, book_link) rows to link documents, tokens included so
+	#this is all of the per-row work and can run in a worker process
 	links = []
-	num = 0
-	#save elements in list with id , name and link
-	for item in result:
-		if links.__len__()-1 != num:
-			links.append({})
-		#links[num]['id'] = item[0]
-		links[num]['name'] = item[1]
-		links[num]['link'] = item[2]
-		if links[num]["link"].lower().endswith(("mp4","mkv","3gp","avi","mov","mpg","mpeg","wmv","m4v")):
-			links[num]["type"] = "video"
-		elif links[num]["link"].lower().endswith(("mp3","aif","mid","midi","mpa","ogg","wav","wma","wpl")):
-			links[num]["type"] = "audio"
-		elif links[num]["link"].lower().endswith(("rar","zip","deb","pkg","tar.gz",".z","rpm",".7z","arj")):
-			links[num]["type"] = "compressed"
-		elif links[num]["link"].lower().endswith(("bin","dmg","iso","toast","vcd")):
-			links[num]["type"] = "disk"
-		elif links[num]["link"].lower().endswith(("exe","apk","bat","com","jar",".py",".wsf")):
-			links[num]["type"] = "executeable"
-		elif links[num]["link"].lower().endswith(("ai","bmp","gif","ico","jpeg","png","jpg","tif","svg")):
-			links[num]["type"] = "image"
-		elif links[num]["link"].lower().endswith(("pdf","txt","doc","rtf","wpd","docx","odt","wps","wks")):
-			links[num]["type"] = "text"
-		else:
-			links[num]["type"] = "others"
-		num += 1
-		#links.append({}) extra append should be created
-
-
-	# for item in links:
-	# 	print(item)
-
-	sql='SELECT * FROM book_links ORDER BY id DESC LIMIT 1;'
-	cursor.execute(sql)
-	result = cursor.fetchall()
-	f = open("num","w")
-	f.write(str(result[0][0]))
-	f.close()
-
-
-	collection.insert_many(links)
+	for item in rows:
+		if item[2]:
+			doc = {"name":item[1],"link":item[2],"type":classifier.classify(item[2]) or "others"}
+			doc["tokens"] = search.link_tokens(doc)
+			links.append(doc)
+	return links
+
+def batches(cursor,batch_size):
+	while True:
+		batch = cursor.fetchmany(batch_size)
+		if not batch:
+			return
+		yield batch
+
+def transformed(cursor,batch_size,workers):
+	"""(last id, documents) per batch, in cursor order. With workers > 1
+	the transform runs in a process pool with a bounded number of batches
+	in flight, results are still handed back in order."""
+	if workers <= 1:
+		for batch in batches(cursor,batch_size):
+			yield batch[-1][0], transform(batch)
+		return
+	with ProcessPoolExecutor(max_workers=workers) as pool:
+		pending = deque()
+		for batch in batches(cursor,batch_size):
+			pending.append((batch[-1][0], pool.submit(transform,batch)))
+			if len(pending) >= workers * 2:
+				last, future = pending.popleft()
+				yield last, future.result()
+		while pending:
+			last, future = pending.popleft()
+			yield last, future.result()
+
+def transfer(cursor,out,num,batch_size=5000,watermark=writeWatermark,workers=1):
+	"""Stream book_links rows with id > num into Mongo in batches of
+	batch_size. The watermark only moves once a batch is written, and
+	the writes are upserts, so a crashed run resumes where it stopped
+	without losing or duplicating links. Returns (links, last id)."""
+	cursor.execute("SELECT id, book_name, book_link FROM book_links WHERE id > %s ORDER BY id",(num,))
+	rows = 0
+	for num, links in transformed(cursor,batch_size,workers):
+		out.add_links(links)
+		out.flush()
+		watermark(num)
+		rows += len(links)
+		print("transferred",rows,"links, up to id",num)
+	return rows, num
+
+def main(batch_size=5000,workers=1,watermarkPath="num"):
+	num = readWatermark(watermarkPath)
+	with db.mysql() as dbmysql:
+		#server side cursor, rows arrive as they are read instead of all at once
+		cursor = dbmysql.cursor(pymysql.cursors.SSCursor)
+		with writer.LinkWriter(collection,db.links("urls"),db.links("errorUrl"),batch_size=batch_size*2) as out:
+			#web workers drop the cached results of the tokens written
+			out.on_commit.append(lambda docs: cache.publish_changes(db.links("meta"),db.links("changes"),
+				(token for doc in docs for token in doc["tokens"])))
+			try:
+				return transfer(cursor,out,num,batch_size,lambda num: writeWatermark(num,watermarkPath),workers)
+			finally:
+				cursor.close()
 
 
 
@@ -155,5 +185,9 @@ def main():
 
 
 if __name__ == '__main__':
-	main()
+	parser = argparse.ArgumentParser(description="copy new book_links rows into links.links")
+	parser.add_argument("--batch-size",type=int,default=5000)
+	parser.add_argument("--workers",type=int,default=1,help="processes for the transform stage")
+	args = parser.parse_args()
+	main(args.batch_size,args.workers)
 	#query(input("Please enter:"))
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""Per-host politeness for the crawler.
+
+HostScheduler decides when a host may be sent its next request: at most
+per_host requests in flight and, with a rate, at least 1/rate seconds
+between requests. The interval adapts: each throttled or failed response
+stretches it by half (up to max_interval), each success shrinks it by a
+fifth back towards 1/rate, so a host failing one request in five still
+settles at its rate. A 429 or 503 with Retry-After holds the host for that
+long; otherwise retries back off exponentially with full jitter.
+"""
+from email.utils import parsedate_to_datetime
+import random
+import time
+import requests
+
+
+RETRY_STATUS = frozenset((429, 500, 502, 503, 504))
+#RequestExceptions are OSErrors too, but these fail the same way every time
+PERMANENT = (requests.exceptions.InvalidURL, requests.exceptions.MissingSchema, requests.exceptions.InvalidSchema,
+	requests.exceptions.InvalidHeader, requests.exceptions.URLRequired, requests.exceptions.TooManyRedirects)
+#----------------------------------------------------------------------------------
+
+def retry_after(value, now=None):
+	"""Seconds to wait from a Retry-After header, None if unusable."""
+	if not value:
+		return None
+	value = value.strip()
+	if value.isdigit():
+		return float(value)
+	try:
+		when = parsedate_to_datetime(value).timestamp()
+	except (TypeError, ValueError, IndexError):
+		return None
+	return max(0.0, when - (now if now is not None else time.time()))
+
+def classify_failure(exc):
+	"""(retryable, status, Retry-After seconds) for a fetch exception."""
+	if isinstance(exc, PERMANENT):
+		return False, None, None
+	response = getattr(exc, "response", None)
+	if response is None:
+		#connection reset, timeout, DNS are worth another try, a page we cannot parse is not
+		return isinstance(exc, (requests.ConnectionError, requests.Timeout, OSError)), None, None
+	status = response.status_code
+	return status in RETRY_STATUS, status, retry_after(response.headers.get("Retry-After"))
+
+class Host(object):
+	__slots__ = ("inflight", "next_at", "interval", "failures")
+
+	def __init__(self, interval):
+		self.inflight = 0
+		self.next_at = 0.0
+		self.interval = interval
+		self.failures = 0
+
+class HostScheduler(object):
+
+	def __init__(self, per_host=4, rate=None, max_retries=4, base_delay=1.0, max_delay=300.0, max_interval=60.0):
+		self.per_host = per_host
+		self.min_interval = 1.0 / rate if rate else 0.0
+		self.max_retries = max_retries
+		self.base_delay = base_delay
+		self.max_delay = max_delay
+		self.max_interval = max_interval
+		self.hosts = {}
+		self.throttled = 0
+		self.retried = 0
+
+	def _host(self, host):
+		state = self.hosts.get(host)
+		if state is None:
+			state = self.hosts[host] = Host(self.min_interval)
+		return state
+
+	def ready_at(self, host, now):
+		"""When host can take another request: now or later, None while
+		all its slots are busy."""
+		state = self._host(host)
+		if state.inflight >= self.per_host:
+			return None
+		return max(now, state.next_at)
+
+	def started(self, host, now):
+		state = self._host(host)
+		state.inflight += 1
+		state.next_at = max(now, state.next_at) + state.interval
+
+	def succeeded(self, host):
+		state = self._host(host)
+		state.inflight -= 1
+		state.failures = 0
+		state.interval = max(self.min_interval, state.interval * 0.8)
+
+	def failed(self, host, attempt, exc, now):
+		"""Record a failed fetch; returns the delay before the url should
+		be tried again, or None when it should be given up on."""
+		state = self._host(host)
+		state.inflight -= 1
+		retryable, status, wait = classify_failure(exc)
+		if status in (429, 503):
+			self.throttled += 1
+		if not retryable:
+			return None
+		state.failures += 1
+		state.interval = min(self.max_interval, max(state.interval * 1.5, self.min_interval, 0.1))
+		if wait is not None:
+			state.next_at = max(state.next_at, now + wait)
+		if attempt >= self.max_retries:
+			return None
+		self.retried += 1
+		if wait is not None:
+			return wait
+		return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
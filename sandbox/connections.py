@@ -1,9 +1,13 @@
-import pymongo
-import pymysql as mysqldb
+import os
+import sys
 
-db=mysqldb.connect("localhost","admin","root","books")
-MySqlCursor = db.cursor()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+#the old names, connecting on first use; db was and stays the MySQL connection
+import db as provider
 
-MongoDB = pymongo.MongoClient(username="admin",password="root",authSource="admin")
-TestdbStudentsCollection = MongoDB.testdb.students
-TestdbUrlsCollection = MongoDB.testdb.urls
\ No newline at end of file
+db = provider.Lazy(provider.mysql_connect)
+MySqlCursor = provider.Lazy(lambda: db.cursor())
+
+MongoDB = provider.Lazy(provider.mongo)
+TestdbStudentsCollection = provider.collection("testdb","students")
+TestdbUrlsCollection = provider.collection("testdb","urls")
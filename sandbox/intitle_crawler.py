@@ -1,11 +1,15 @@
-from bs4 import BeautifulSoup as soup
-import pymongo
+import os
+import sys
 import requests
 import urllib.request
 
-MongoDB = pymongo.MongoClient(username="admin",password="root",authSource="admin")
-TestdbStudentsCollection = MongoDB.testdb.links
-TestdbUrlsCollection = MongoDB.testdb.urls
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import classifier
+import db
+import listing
+
+TestdbStudentsCollection = db.collection("testdb","links")
+TestdbUrlsCollection = db.collection("testdb","urls")
 
 
 #url = 'https://theswissbay.ch/pdf/Gentoomen%20Library/Programming/Python/'
@@ -32,73 +36,34 @@ def Crawl(url):
 		page_html = response.read()
 		response.close()
 		print("Parsing URL..."+ url)
-		page_soup = soup(page_html, "html.parser")
-		links = page_soup.findAll("a",href=True)
+		links = listing.extract_links(page_html)
 	except:
 		print("This ended in an error ----> ",url)
 	try:
 		dirLink = []
 		num = 0
-		for link in links:
-			completeLink = url+link["href"]
+		for href, text in links:
+			completeLink = url+href
 
-			if link["href"].endswith("/") and not link["href"].endswith("../") and not link["href"].startswith("/"):
+			if href.endswith("/") and not href.endswith("../") and not href.startswith("/"):
 				#print(link)
 
 				#print(url+link["href"])    #new link to crawl
 
 				#print("\nurl =",url ,"\nlink[href] =", link["href"],"\nlink =", link,"\n \n")
-				Crawl(str(url+link["href"]))
+				Crawl(str(url+href))
 			else:
 				#print("General link")
 				if dirLink.__len__()-1 != num:
 					dirLink.append({})
-				fullLink=str(url+link["href"])
+				fullLink=str(url+href)
 				#print("\nurl =",url ,"\nlink[href] =", link["href"],"\nlink+url =", url+link["href"],"\n \n")
-				if fullLink.lower().endswith(("mp4","mkv","3gp","avi","mov","mpg","mpeg","wmv","m4v")):
-					# print("\nurl =",url ,"\nlink[href] =", link["href"],"\nlink+url =", fullLink,"\nlink.text =", link.text,"\n \n")
-					dirLink[num]["name"]=link.text
-					dirLink[num]["link"]=fullLink
-					dirLink[num]["type"]="video"
-					num += 1
-				elif fullLink.lower().endswith(("mp3","aif","mid","midi","mpa","ogg","wav","wma","wpl")):
-					# print("\nurl =",url ,"\nlink[href] =", link["href"],"\nlink+url =", fullLink,"\nlink.text =", link.text,"\n \n")
-					dirLink[num]["name"]=link.text
-					dirLink[num]["link"]=fullLink
-					dirLink[num]["type"]="audio"
-					num += 1
-				elif fullLink.lower().endswith(("rar","zip","deb","pkg","tar.gz",".z","rpm",".7z","arj")):
-					# print("\nurl =",url ,"\nlink[href] =", link["href"],"\nlink+url =", fullLink,"\nlink.text =", link.text,"\n \n")
-					dirLink[num]["name"]=link.text
-					dirLink[num]["link"]=fullLink
-					dirLink[num]["type"]="compressed"
-					num += 1
-				elif fullLink.lower().endswith(("bin","dmg","iso","toast","vcd")):
-					# print("\nurl =",url ,"\nlink[href] =", link["href"],"\nlink+url =", fullLink,"\nlink.text =", link.text,"\n \n")
-					dirLink[num]["name"]=link.text
-					dirLink[num]["link"]=fullLink
-					dirLink[num]["type"]="disk"
-					num += 1
-				elif fullLink.lower().endswith(("exe","apk","bat","com","jar",".py",".wsf")):
-					# print("\nurl =",url ,"\nlink[href] =", link["href"],"\nlink+url =", fullLink,"\nlink.text =", link.text,"\n \n")
-					dirLink[num]["name"]=link.text
-					dirLink[num]["link"]=fullLink
-					dirLink[num]["type"]="executable"
-					num += 1
-				elif fullLink.lower().endswith(("ai","bmp","gif","ico","jpeg","png","jpg","tif","svg")):
-					# print("\nurl =",url ,"\nlink[href] =", link["href"],"\nlink+url =", fullLink,"\nlink.text =", link.text,"\n \n")
-					dirLink[num]["name"]=link.text
-					dirLink[num]["link"]=fullLink
-					dirLink[num]["type"]="image"
-					num += 1
-				elif fullLink.lower().endswith(("pdf","txt","doc","rtf","wpd","docx","odt","wps","wks")):
-					# print("\nurl =",url ,"\nlink[href] =", link["href"],"\nlink+url =", fullLink,"\nlink.text =", link.text,"\n \n")
-					dirLink[num]["name"]=link.text
+				linkType = classifier.classify(fullLink)
+				if linkType is not None:
+					dirLink[num]["name"]=text
 					dirLink[num]["link"]=fullLink
-					dirLink[num]["type"]="text"
+					dirLink[num]["type"]=linkType
 					num += 1
-				else:
-					pass		
 			#sql = "insert into book_links(book_name,book_link) values(\"%s\",\"%s\")" % (str(link.text),str(completeLink)) 
 			# try:
 			# 	cursor.execute(sql)
@@ -0,0 +1,130 @@
+"""Token index for link search.
+
+Every link document carries a "tokens" array: the lower-cased words of its
+name and of its URL path (percent-decoded, split on anything that is not a
+letter or digit). A multikey index on tokens answers a search with anchored
+prefix matches, which Mongo can walk in index order instead of scanning
+every link with an unanchored case-insensitive $regex.
+
+Results come in relevance order: the first CANDIDATES matches in _id
+order are ranked by score() and paged through with offset cursors ("10",
+"20", ...). Past them pages continue by keyset on _id (cursor: the last
+_id seen, as hex), ranked within each page, so a deep page costs what the
+first one does.
+"""
+import re
+from urllib.parse import unquote, urlsplit
+from bson.objectid import ObjectId
+import pymongo
+
+
+split = re.compile(r"[\W_]+", re.UNICODE).split
+#matches ranked together for the first pages
+CANDIDATES = 200
+#----------------------------------------------------------------------------------
+
+def tokenize(text):
+	return [token for token in split(text.lower()) if token]
+
+def link_tokens(doc):
+	"""Distinct tokens of a link document, name first."""
+	tokens = tokenize(doc.get("name") or "")
+	tokens += tokenize(unquote(urlsplit(doc["link"]).path))
+	return list(dict.fromkeys(tokens))
+
+def ensure_index(collection):
+	collection.create_index([("tokens", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)])
+	collection.create_index([("type", pymongo.ASCENDING), ("tokens", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)])
+
+def backfill(collection, batch_size=1000):
+	"""Add tokens to links written before the index existed."""
+	updated = 0
+	requests = []
+	for doc in collection.find({"tokens":{"$exists":False}},{"name":1,"link":1}):
+		requests.append(pymongo.UpdateOne({"_id":doc["_id"]},{"$set":{"tokens":link_tokens(doc)}}))
+		if len(requests) == batch_size:
+			updated += collection.bulk_write(requests, ordered=False).modified_count
+			requests = []
+	if requests:
+		updated += collection.bulk_write(requests, ordered=False).modified_count
+	return updated
+
+#----------------------------------------------------------------------------------
+
+def term_filter(term):
+	#exact token or token prefix, anchored so the index bounds apply
+	return {"tokens":{"$regex":"^"+re.escape(term)}}
+
+def score(doc, terms):
+	"""Rank a hit: whole-word matches beat prefix matches and matches in
+	the name beat matches in the path; shorter names win ties."""
+	name = set(tokenize(doc.get("name") or ""))
+	tokens = doc.get("tokens") or []
+	total = 0.0
+	for term in terms:
+		if term in name:
+			total += 3
+		elif any(token.startswith(term) for token in name):
+			total += 2
+		elif term in tokens:
+			total += 1
+		else:
+			total += 0.5
+	return (-total, len(doc.get("name") or ""))
+
+def parse_cursor(after):
+	"""Cursor string of a page: None, an offset into the ranked matches or
+	an _id (InvalidId when it is neither)."""
+	if after is None:
+		return None
+	if after.isdigit():
+		return int(after)
+	return ObjectId(after)
+
+def ranked_page(window, more, offset, limit, key, last):
+	"""Page at offset of the window of first matches ranked by key, and the
+	next cursor: the next offset, last (the window's highest _id) when
+	more matches follow the window, or None."""
+	ranked = sorted(window, key=key)
+	page = ranked[offset:offset + limit]
+	if offset + limit < len(window):
+		return page, offset + limit
+	return page, last if more else None
+
+def find(collection, query, linkType=None, after=None, limit=10, max_time_ms=None, candidates=CANDIDATES):
+	"""One page of links matching every token of query, and the cursor for
+	the next page (None on the last one): an int offset while inside the
+	ranked window, an _id past it. after is a cursor from parse_cursor.
+	With max_time_ms the server gives up on a slower query and pymongo
+	raises ExecutionTimeout.
+	"""
+	terms = tokenize(query)
+	if not terms:
+		return [], None
+	clauses = [term_filter(term) for term in terms]
+	if linkType:
+		clauses.append({"type":linkType})
+	offset = None
+	if isinstance(after, int):
+		offset = after
+	elif after is not None:
+		clauses.append({"_id":{"$gt":after}})
+	count = candidates if offset is not None or after is None else limit
+	cursor = collection.find({"$and":clauses}).sort("_id", pymongo.ASCENDING).limit(count + 1)
+	if max_time_ms:
+		cursor = cursor.max_time_ms(max_time_ms)
+	hits = list(cursor)
+	more = len(hits) > count
+	hits = hits[:count]
+	rank = lambda doc: score(doc, terms)
+	if after is None or offset is not None:
+		return ranked_page(hits, more, offset or 0, limit, rank, hits[-1]["_id"] if hits else None)
+	nextPage = hits[-1]["_id"] if more else None
+	hits.sort(key=rank)
+	return hits, nextPage
+
+if __name__ == '__main__':
+	#build the index and tokenise links written before it existed
+	import model
+	ensure_index(model.LinksLinksCollection)
+	print("tokenised:",backfill(model.LinksLinksCollection))
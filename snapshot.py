@@ -0,0 +1,287 @@
+"""Read-only snapshot of the links collection for the search tier.
+
+One file, mapped with mmap, so every web worker on a host shares a single
+copy in the page cache and answers searches without a database round
+trip. Links are stored in _id order, column by column:
+
+	ids              12 bytes a link, the ObjectId, for the same page cursors
+	                 the Mongo path hands out
+	types            one byte a link, a code into the type names in the header
+	offsets          uint64 offsets into strings, name and link of link i at
+	                 2i and 2i+1
+	strings          every name and link, UTF-8, back to back
+	token_offsets    uint64 offsets into tokens
+	tokens           the distinct search tokens, UTF-8, sorted
+	posting_offsets  uint64 offsets into postings, one run per token
+	postings         uint32 link numbers, ascending within a token
+
+A search looks its terms up in the sorted tokens with bisect (a prefix
+matches a run of neighbouring tokens), walks the postings of the term with
+the fewest, and checks the other terms and the type on each candidate
+until it has the ranked window or a page: the same matches, order and
+cursors as search.find.
+
+Build one with
+
+	python snapshot.py build links.snap
+
+and point LINKS_SNAPSHOT at it; model.getList reopens the file when a
+rebuild replaces it. A snapshot does not see links written after it was
+built, so rebuild it after crawls or on a timer.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+import heapq
+from itertools import islice
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+import search
+
+
+MAGIC = b"LNKSNAP1"
+SECTIONS = ("ids", "types", "offsets", "strings", "token_offsets", "tokens", "posting_offsets", "postings")
+#----------------------------------------------------------------------------------
+
+class Strings(object):
+	"""The i-th string of a blob as bytes, for bisect."""
+
+	def __init__(self, offsets, blob):
+		self.offsets = offsets
+		self.blob = blob
+
+	def __len__(self):
+		return len(self.offsets) - 1
+
+	def __getitem__(self, i):
+		return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+class Ids(object):
+
+	def __init__(self, view):
+		self.view = view
+
+	def __len__(self):
+		return len(self.view) // 12
+
+	def __getitem__(self, i):
+		return bytes(self.view[12 * i:12 * i + 12])
+
+def build(docs, path, generation=0):
+	"""Write the snapshot of docs, which must come in ascending _id order,
+	to path. The file is written next to it and renamed into place, so
+	workers never map a half written snapshot. Returns the link count."""
+	typeCodes = {}
+	ids = bytearray()
+	codes = bytearray()
+	offsets = array("Q", [0])
+	postings = {}
+	previous = None
+	directory = os.path.dirname(os.path.abspath(path))
+	with tempfile.TemporaryFile(dir=directory) as strings:
+		size = 0
+		for number, doc in enumerate(docs):
+			binary = doc["_id"].binary
+			if previous is not None and binary <= previous:
+				raise ValueError("links must come in ascending _id order")
+			previous = binary
+			ids += binary
+			code = typeCodes.setdefault(doc.get("type") or "", len(typeCodes))
+			if code > 255:
+				raise ValueError("more than 256 link types")
+			codes.append(code)
+			for text in (doc.get("name") or "", doc.get("link") or ""):
+				encoded = text.encode("utf-8")
+				strings.write(encoded)
+				size += len(encoded)
+				offsets.append(size)
+			for token in set(doc.get("tokens") or search.link_tokens(doc)):
+				postings.setdefault(token.encode("utf-8"), array("I")).append(number)
+		tokens = sorted(postings)
+		tokenOffsets = array("Q", [0])
+		postingOffsets = array("Q", [0])
+		for token in tokens:
+			tokenOffsets.append(tokenOffsets[-1] + len(token))
+			postingOffsets.append(postingOffsets[-1] + len(postings[token]))
+		strings.seek(0)
+		sections = {
+			"ids": [bytes(ids)], "types": [bytes(codes)], "offsets": [offsets.tobytes()], "strings": strings,
+			"token_offsets": [tokenOffsets.tobytes()], "tokens": tokens,
+			"posting_offsets": [postingOffsets.tobytes()], "postings": (postings[token].tobytes() for token in tokens),
+		}
+		lengths = {"ids": len(ids), "types": len(codes), "offsets": len(offsets) * 8, "strings": size,
+			"token_offsets": len(tokenOffsets) * 8, "tokens": tokenOffsets[-1],
+			"posting_offsets": len(postingOffsets) * 8, "postings": postingOffsets[-1] * 4}
+		header = {"count": len(codes), "tokens": len(tokens), "generation": generation, "built": time.time(),
+			"types": sorted(typeCodes, key=typeCodes.get), "sections": {}}
+		#section offsets depend on the header length, which depends on the offsets: reserve room
+		position = 4096
+		for name in SECTIONS:
+			header["sections"][name] = [position, lengths[name]]
+			position += (lengths[name] + 7) // 8 * 8
+		encoded = json.dumps(header).encode("utf-8")
+		if len(MAGIC) + 4 + len(encoded) > 4096:
+			raise ValueError("snapshot header too long")
+		tmp = path + ".tmp"
+		with open(tmp, "wb") as out:
+			out.write(MAGIC + struct.pack("<I", len(encoded)) + encoded)
+			for name in SECTIONS:
+				out.seek(header["sections"][name][0])
+				chunks = sections[name]
+				if name == "strings":
+					chunks = iter(lambda: strings.read(1 << 20), b"")
+				for chunk in chunks:
+					out.write(chunk)
+			out.truncate(position)
+			out.flush()
+			os.fsync(out.fileno())
+		os.replace(tmp, path)
+	return len(codes)
+
+#----------------------------------------------------------------------------------
+
+def contains(run, number):
+	i = bisect_left(run, number)
+	return i < len(run) and run[i] == number
+
+class Snapshot(object):
+
+	def __init__(self, path):
+		self.path = path
+		with open(path, "rb") as f:
+			self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		if self.map[:len(MAGIC)] != MAGIC:
+			raise ValueError("%s is not a links snapshot" % path)
+		length = struct.unpack_from("<I", self.map, len(MAGIC))[0]
+		self.header = json.loads(self.map[len(MAGIC) + 4:len(MAGIC) + 4 + length].decode("utf-8"))
+		view = memoryview(self.map)
+		section = {name: view[start:start + size] for name, (start, size) in self.header["sections"].items()}
+		self.ids = Ids(section["ids"])
+		self.codes = section["types"]
+		self.offsets = section["offsets"].cast("Q")
+		self.strings = section["strings"]
+		self.tokens = Strings(section["token_offsets"].cast("Q"), section["tokens"])
+		self.postingOffsets = section["posting_offsets"].cast("Q")
+		self.postings = section["postings"].cast("I")
+		self.types = self.header["types"]
+		self.typeCodes = dict((name, code) for code, name in enumerate(self.types))
+
+	def __len__(self):
+		return self.header["count"]
+
+	def _string(self, i):
+		return str(self.strings[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+	def doc(self, number):
+		return {"id": self.ids[number].hex(), "name": self._string(2 * number), "link": self._string(2 * number + 1),
+			"type": self.types[self.codes[number]] or None}
+
+	def _runs(self, term):
+		"""Postings of every token starting with term."""
+		prefix = term.encode("utf-8")
+		runs = []
+		i = bisect_left(self.tokens, prefix)
+		while i < len(self.tokens) and self.tokens[i].startswith(prefix):
+			runs.append(self.postings[self.postingOffsets[i]:self.postingOffsets[i + 1]])
+			i += 1
+		return runs
+
+	def _matches(self, terms, code, start):
+		"""Docs of the links from number start on matching every term and the
+		type code, in _id order."""
+		matches = sorted(((term, self._runs(term)) for term in terms), key=lambda match: sum(len(run) for run in match[1]))
+		driver = matches[0][1]
+		#other terms matching a few tokens are checked in their postings, the
+		#rest (short prefixes) against the candidate's own tokens
+		probed = [runs for term, runs in matches[1:] if len(runs) <= 16]
+		rescanned = [term for term, runs in matches[1:] if len(runs) > 16]
+		last = -1
+		for number in heapq.merge(*[run[bisect_left(run, start):] for run in driver]):
+			if number == last:
+				continue
+			last = number
+			if code is not None and self.codes[number] != code:
+				continue
+			if not all(any(contains(run, number) for run in other) for other in probed):
+				continue
+			doc = self.doc(number)
+			if rescanned:
+				tokens = search.link_tokens(doc)
+				if not all(any(token.startswith(term) for token in tokens) for term in rescanned):
+					continue
+			yield doc
+
+	def find(self, query, linkType=None, after=None, limit=10, candidates=search.CANDIDATES):
+		"""search.find over the snapshot: one page of link dicts for getList
+		and the cursor string of the next page, or None."""
+		terms = search.tokenize(query)
+		if not terms:
+			return [], None
+		code = None
+		if linkType:
+			code = self.typeCodes.get(linkType)
+			if code is None:
+				return [], None
+		cursor = search.parse_cursor(after)
+		rank = lambda doc: search.score(dict(doc, tokens=search.link_tokens(doc)), terms)
+		if cursor is None or isinstance(cursor, int):
+			window = list(islice(self._matches(terms, code, 0), candidates + 1))
+			more = len(window) > candidates
+			window = window[:candidates]
+			page, nextPage = search.ranked_page(window, more, cursor or 0, limit, rank, window[-1]["id"] if window else None)
+		else:
+			hits = list(islice(self._matches(terms, code, bisect_right(self.ids, cursor.binary)), limit + 1))
+			nextPage = hits[limit - 1]["id"] if len(hits) > limit else None
+			page = sorted(hits[:limit], key=rank)
+		return page, None if nextPage is None else str(nextPage)
+
+class SnapshotFile(object):
+	"""The snapshot at path, reopened when a rebuild replaced the file;
+	None while there is no file."""
+
+	def __init__(self, path, check_interval=5.0):
+		self.path = path
+		self.check_interval = check_interval
+		self.snapshot = None
+		self.identity = None
+		self.checked = 0.0
+
+	def get(self):
+		now = time.monotonic()
+		if now - self.checked >= self.check_interval:
+			self.checked = now
+			try:
+				stat = os.stat(self.path)
+			except OSError:
+				self.snapshot = None
+				return None
+			identity = (stat.st_ino, stat.st_mtime_ns)
+			if identity != self.identity:
+				#the old map stays valid for searches still using it, it closes when dropped
+				self.snapshot = Snapshot(self.path)
+				self.identity = identity
+		return self.snapshot
+
+#----------------------------------------------------------------------------------
+
+def rebuild(collection, path, generation=0, batch_size=10000):
+	docs = collection.find({}, {"name":1,"link":1,"type":1,"tokens":1}, batch_size=batch_size).sort("_id", 1)
+	return build(docs, path, generation)
+
+if __name__ == '__main__':
+	import argparse
+	import cache
+	import model
+	parser = argparse.ArgumentParser(description="snapshot the links collection for the search tier")
+	commands = parser.add_subparsers(dest="command", required=True)
+	builder = commands.add_parser("build")
+	builder.add_argument("path", nargs="?", default=model.linksSnapshotPath or "links.snap")
+	args = parser.parse_args()
+	start = time.perf_counter()
+	#read the generation first: links written during the build make the snapshot look stale, not fresh
+	generation = cache.read_generation(model.LinksMetaCollection)
+	count = rebuild(model.LinksLinksCollection, args.path, generation)
+	print("snapshot:", count, "links,", os.path.getsize(args.path), "bytes in %.1fs" % (time.perf_counter() - start))
@@ -1,42 +1,85 @@
 $(document).ready(function() {
 	//This is where the data is sent
 	$('#searchForm').on('submit',function (event) {
+		searchPage(null);
+		event.preventDefault();
+	});
+
+	//next page, continues after the last result shown
+	$('#searchResponse').on('click','#moreResults',function (event) {
+		searchPage($(this).data('after'));
+		event.preventDefault();
+	});
+
+	//completions for the word being typed, a request at most every 100ms;
+	//answers to older keystrokes are dropped
+	var completeTimer = null;
+	var completeSent = 0;
+	$('#search').on('input',function () {
+		clearTimeout(completeTimer);
+		completeTimer = setTimeout(function () {
+			var sent = ++completeSent;
+			$.ajax({
+				url: '/complete',
+				type: 'GET',
+				data: {q:$('#search').val()},
+				dataType: "json",
+			})
+			.done(function(data) {
+				if (sent != completeSent)
+					return;
+				var options = $('#completions').empty();
+				$.each(data.completions || [],function(key,value) {
+					options.append($('<option>').attr('value',value.text));
+				});
+			});
+		},100);
+	});
+
+	function searchPage(after) {
 		//-------------------
 		//get values from form
 		var search = $('#search').val();
 		var type = $('#type').val();
+		var query = {search:search,type:type};
+		if (after)
+			query.after = after;
 		//-------------------
 		$.ajax({
 			url: '/searchAJAX',
 			type: 'GET',
-			data: {search:search,type:type},
+			data: query,
 			dataType: "json",
 		})
 		//this is where the response is received
 		.done(function(data) {
-			var data = JSON.stringify(data);
 			//console.log("success " + JSON.stringify(data));
 			var displayData;
 			displayData = '';
-			displayData += '<thead class="thead-dark"><tr><th>Name</th><th>Link</th><th>Type</th></tr></thead>';
-			$.each(JSON.parse(data),function(key,value) {
-				displayData += '<tbody id="tableBody">';
+			if (!after)
+				displayData += '<thead class="thead-dark"><tr><th>Name</th><th>Link</th><th>Type</th></tr></thead>';
+			displayData += '<tbody class="tableBody">';
+			$.each(data.links || [],function(key,value) {
 				displayData += '<tr>';
 				//displayData += '<th scope="row">'+value.id+'</th>';
 				displayData += '<th scope="row">'+value.name+'</th>';
 				displayData += '<td class="d-inline-block col-8"><a class="text-muted" href='+value.link+'><p style="width: 500px; word-warp: word-break;">'+value.link+'</p></a></td>';
 				displayData += '<td>'+value.type+'</td>';
 				displayData += '</tr>';
-				displayData += '</tbody>';
 			});
-			if (data.length > 17)
+			displayData += '</tbody>';
+			$('#moreResults').closest('tbody').remove();
+			if (data.after)
+				displayData += '<tbody><tr><td colspan="3"><button class="btn btn-outline-primary" id="moreResults" data-after="'+data.after+'">More results</button></td></tr></tbody>';
+			if (data.links && after)
+				$('#searchResponse').append(displayData);
+			else if (data.links)
 				$('#searchResponse').html(displayData);
-			else
+			else if (!after)
 				$('#searchResponse').html('<p class="text-danger" id="noItemsFound">No items found.. Please check the spelling or the type</p>')
 
-		});		
-		event.preventDefault();
-	});
+		});
+	}
 
 //--------------------------------------------------------------------------------------
 
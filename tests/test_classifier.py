@@ -0,0 +1,64 @@
+"""classifier.classify against the old endswith() chain, one case a line.
+
+	python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import classifier
+from bench_classify import legacy
+
+#url, old chain, classify
+SAME = [
+	("http://mirror.example.org/pub/film.mp4", "video", "video"),
+	("http://mirror.example.org/pub/Track.MP3", "audio", "audio"),
+	("http://mirror.example.org/pub/src.tar.gz", "compressed", "compressed"),
+	("http://mirror.example.org/pub/old.7z", "compressed", "compressed"),
+	("http://mirror.example.org/pub/setup.exe", "executable", "executable"),
+	("http://mirror.example.org/pub/logo.svg", "image", "image"),
+	("http://mirror.example.org/pub/paper.pdf", "text", "text"),
+	("http://mirror.example.org/pub/debian.iso", "disk", "disk"),
+	("http://mirror.example.org/pub/index.html", None, None),
+	("http://mirror.example.org/pub/src.gz", None, None),
+]
+#the fixes listed in classifier's docstring
+BARE_SUFFIX = [
+	("http://mirror.example.org/pub/thai", "image", None),
+	("http://mirror.example.org/pub/cabin", "disk", None),
+	("http://mirror.example.org/pub/telecom", "executable", None),
+	("http://example.com", "executable", None),
+	("mp4", "video", None),
+	("mailto:me@example.com", "executable", None),
+	("ftp://mirror.example.org/pub/film.mp4", "video", None),
+]
+QUERY = [
+	("http://mirror.example.org/pub/film.mp4?dl=1", None, "video"),
+	("http://mirror.example.org/pub/film.mkv#t=10", None, "video"),
+	("http://mirror.example.org/pub/?C=M;O=A.zip", "compressed", None),
+]
+
+
+def check(cases):
+	for url, old, new in cases:
+		assert legacy(url) == old, url
+		assert classifier.classify(url) == new, url
+
+def test_same_as_old_chain():
+	check(SAME)
+
+def test_bare_suffixes_are_not_extensions():
+	check(BARE_SUFFIX)
+
+def test_query_and_fragment_ignored():
+	check(QUERY)
+
+def test_executable_spelling():
+	assert "executable" in classifier.TYPES
+	assert "executeable" not in classifier.TYPES
+
+def test_classify_all_matches_classify():
+	urls = [url for url, old, new in SAME + BARE_SUFFIX + QUERY]
+	assert classifier.classify_all(urls) == [classifier.classify(url) for url in urls]
@@ -0,0 +1,125 @@
+import atexit
+from datetime import datetime, timezone
+import time
+import pymongo
+from pymongo.errors import OperationFailure
+import metrics
+import search
+
+
+WRITE_SECONDS = metrics.histogram("writer_bulk_write_seconds", "Time per bulk upsert, by collection", ["kind"])
+WRITTEN = metrics.counter("writer_documents_total", "Documents upserted, by collection", ["kind"])
+#----------------------------------------------------------------------------------
+
+def remove_duplicates(collection, key):
+	"""Keep the first document for every value of key and delete the rest,
+	so a unique index can be built on a collection filled by old crawls."""
+	pipeline = [{"$group":{"_id":"$"+key,"ids":{"$push":"$_id"},"count":{"$sum":1}}},{"$match":{"count":{"$gt":1}}}]
+	removed = 0
+	for group in collection.aggregate(pipeline, allowDiskUse=True):
+		removed += collection.delete_many({"_id":{"$in":group["ids"][1:]}}).deleted_count
+	return removed
+
+def ensure_unique(collection, key):
+	try:
+		collection.create_index([(key, pymongo.ASCENDING)], unique=True)
+	except OperationFailure:
+		remove_duplicates(collection, key)
+		collection.create_index([(key, pymongo.ASCENDING)], unique=True)
+
+#----------------------------------------------------------------------------------
+
+class LinkWriter(object):
+	"""Buffers crawl results and writes them as unordered bulk upserts.
+
+	Links get their search tokens and are keyed on link, directory records
+	on url and errors on ErrorUrl, each with a unique index, so writing the
+	same result twice leaves one document. A buffer is flushed once it holds batch_size
+	entries or flush_interval seconds after the last flush, and everything
+	left is flushed on close(), at the end of a with block and at
+	interpreter exit. A flush that fails keeps what it did not write for
+	the next one.
+
+	Callables in on_commit get the link documents of every flushed batch
+	once it is written.
+	"""
+
+	def __init__(self, links, urls, errors, batch_size=1000, flush_interval=5.0):
+		self.links = links
+		self.urls = urls
+		self.errors = errors
+		self.batch_size = batch_size
+		self.flush_interval = flush_interval
+		self.pending = {"links":{},"urls":{},"errors":{}}
+		self.flushed = time.monotonic()
+		self.operations = 0
+		self.written = 0
+		self.on_commit = []
+		ensure_unique(links, "link")
+		ensure_unique(urls, "url")
+		ensure_unique(errors, "ErrorUrl")
+		search.ensure_index(links)
+		atexit.register(self.close)
+
+	def add_links(self, docs):
+		for doc in docs:
+			if "tokens" not in doc:
+				doc["tokens"] = search.link_tokens(doc)
+			self.pending["links"][doc["link"]] = doc
+		self._maybe_flush()
+
+	def add_url(self, url):
+		self.pending["urls"][url] = {"url":url}
+		self._maybe_flush()
+
+	def add_error(self, url):
+		self.pending["errors"][url] = {"ErrorUrl":url,"failedAt":datetime.now(timezone.utc)}
+		self._maybe_flush()
+
+	def _maybe_flush(self):
+		if max(len(buffer) for buffer in self.pending.values()) >= self.batch_size:
+			self.flush()
+		elif time.monotonic() - self.flushed >= self.flush_interval:
+			self.flush()
+
+	def _write(self, kind, collection, key, buffer, update):
+		if not buffer:
+			return
+		requests = [pymongo.UpdateOne({key:value},{update:doc},upsert=True) for value, doc in buffer.items()]
+		with WRITE_SECONDS.time(kind=kind):
+			collection.bulk_write(requests, ordered=False)
+		WRITTEN.inc(len(requests), kind=kind)
+		self.operations += 1
+		self.written += len(requests)
+
+	def flush(self):
+		pending, self.pending = self.pending, {"links":{},"urls":{},"errors":{}}
+		self.flushed = time.monotonic()
+		written = []
+		try:
+			for kind, collection, key, update in (("links", self.links, "link", "$set"), ("urls", self.urls, "url", "$setOnInsert"),
+					("errors", self.errors, "ErrorUrl", "$set")):
+				self._write(kind, collection, key, pending[kind], update)
+				written.append(kind)
+		except Exception:
+			#put back what was not written, the next flush or close() retries it;
+			#entries added since are newer and win
+			for kind in pending:
+				if kind not in written:
+					pending[kind].update(self.pending[kind])
+					self.pending[kind] = pending[kind]
+			raise
+		if pending["links"]:
+			docs = list(pending["links"].values())
+			for callback in self.on_commit:
+				callback(docs)
+
+	def close(self):
+		self.flush()
+		atexit.unregister(self.close)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()